@@ -5,9 +5,36 @@ import aiohttp
 import aiofiles
 import requests
 import tarfile
+import json
+import hashlib
+import sqlite3
+import threading
+import atexit
+import weakref
+import random
+import struct
+import zlib
+import zipfile
+import re
+import fnmatch
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from array import array
+from functools import partial
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
-from datetime import datetime
-from typing import List, Dict
+from datetime import datetime, date, timedelta
+from typing import List, Dict, Optional, Callable, Awaitable, Tuple, Union
+
+try:
+    import fcntl  # POSIX only; used to serialize logins between processes sharing a key file
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    import numpy as np  # Optional; vectorizes WRS-2 index lookups
+except ImportError:
+    np = None
 
 # How to use this script:
 # 1. Set the EARTHDATA_USER and EARTHDATA_TOKEN environment variables to your Earthdata username and token.
@@ -31,6 +58,1919 @@ except KeyError as e:
 
 
 
+M2M_BASE_URL = "https://m2m.cr.usgs.gov/api/api/json/stable/"
+
+# Per-endpoint (connect, read) timeouts in seconds.  Metadata calls are small and should fail fast,
+# while download-request / download-retrieve can take a while on the server side.
+DEFAULT_M2M_TIMEOUTS = {
+    "default": (10, 30),
+    "login-token": (10, 30),
+    "logout": (5, 10),
+    "scene-search": (10, 120),
+    "download-options": (10, 120),
+    "download-request": (10, 180),
+    "download-retrieve": (10, 120),
+}
+
+
+# M2M errorCodes meaning the API key is no longer accepted and a fresh login is needed.
+AUTH_EXPIRED_ERROR_CODES = {"AUTH_INVALID", "AUTH_KEY_INVALID", "AUTH_UNAUTHORIZED", "AUTH_UNAUTHROIZED"}
+
+
+class M2MError(Exception):
+    """An error reported by the M2M API in the `errorCode`/`errorMessage` members of a response."""
+
+    def __init__(self, error_code: str, error_message: str = ""):
+        super().__init__(f"{error_code}: {error_message}")
+        self.error_code = error_code
+        self.error_message = error_message
+
+
+# HTTP statuses and M2M errorCodes that indicate a transient condition worth retrying.
+RETRYABLE_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+# Statuses with which the download host rejects a signed URL that has expired; a fresh URL is
+# fetched through download-retrieve instead of giving up on the file.
+EXPIRED_URL_HTTP_STATUSES = {401, 403, 410}
+RETRYABLE_M2M_ERROR_CODES = {
+    "RATE_LIMIT",
+    "RATE_LIMIT_USER_DL",
+    "DOWNLOAD_RATE_LIMIT",
+    "TEMPORARILY_UNAVAILABLE",
+    "SERVICE_UNAVAILABLE",
+    "SYSTEM_UNAVAILABLE",
+}
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for transient M2M failures.
+
+    Args:
+        max_attempts: Total number of attempts per call, including the first one.
+        backoff_base: Delay in seconds before the first retry; doubled on each further retry.
+        backoff_cap: Upper bound for a single delay in seconds.
+        jitter: If True, each delay is drawn uniformly from [0, backoff] ("full jitter") so that
+            many workers failing at once do not retry in lockstep.
+        retryable_statuses: HTTP status codes that are retried.
+        retryable_error_codes: M2M `errorCode` values that are retried.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 60.0,
+        jitter: bool = True,
+        retryable_statuses=RETRYABLE_HTTP_STATUSES,
+        retryable_error_codes=RETRYABLE_M2M_ERROR_CODES,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jitter = jitter
+        self.retryable_statuses = set(retryable_statuses)
+        self.retryable_error_codes = set(retryable_error_codes)
+
+    def is_retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, M2MError):
+            return exc.error_code in self.retryable_error_codes
+        if isinstance(exc, requests.HTTPError):
+            return exc.response is not None and exc.response.status_code in self.retryable_statuses
+        if isinstance(exc, aiohttp.ClientResponseError):
+            return exc.status in self.retryable_statuses
+        return isinstance(exc, (requests.ConnectionError, requests.Timeout, aiohttp.ClientConnectionError,
+                                aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+    def delay(self, attempt: int) -> float:
+        """Returns the delay before retry number `attempt` (1-based)."""
+        backoff = min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+
+# Token-bucket settings per endpoint family: (requests per second, burst size).
+DEFAULT_M2M_RATE_LIMITS = {
+    "search": (2.0, 5),
+    "options": (2.0, 5),
+    "download": (1.0, 3),
+    "default": (5.0, 5),
+}
+M2M_ENDPOINT_FAMILIES = {
+    "scene-search": "search",
+    "download-options": "options",
+    "download-request": "download",
+    "download-retrieve": "download",
+}
+RATE_LIMIT_ERROR_CODES = {"RATE_LIMIT", "RATE_LIMIT_USER_DL", "DOWNLOAD_RATE_LIMIT"}
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Takes one token and returns how long the caller must wait for it (0 if available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Client-side token-bucket rate limiter per M2M endpoint family with adaptive slowdown.
+
+    Each family ("search", "options", "download", "default") has its own bucket.  When the API
+    signals throttling (HTTP 429 or a rate-limit `errorCode`) the family's rate is multiplied by
+    `decrease_factor`; every successful call then raises it by `recovery_step` requests/second
+    until the configured rate is reached again.  One instance may be shared by several clients.
+
+    Args:
+        rates: Mapping of family name to `(requests_per_second, burst)`, merged over the defaults.
+        min_rate: Lower bound for the adaptive rate, in requests per second.
+        decrease_factor: Multiplier applied to the rate on each throttling response.
+        recovery_step: Rate increase (requests per second) applied on each successful call.
+    """
+
+    def __init__(
+        self,
+        rates: Optional[Dict[str, tuple]] = None,
+        min_rate: float = 0.1,
+        decrease_factor: float = 0.5,
+        recovery_step: float = 0.05,
+    ):
+        configured = dict(DEFAULT_M2M_RATE_LIMITS)
+        if rates:
+            configured.update(rates)
+        self.min_rate = min_rate
+        self.decrease_factor = decrease_factor
+        self.recovery_step = recovery_step
+        self._buckets = {family: _TokenBucket(rate, burst) for family, (rate, burst) in configured.items()}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint: str) -> _TokenBucket:
+        return self._buckets.get(M2M_ENDPOINT_FAMILIES.get(endpoint, "default"), self._buckets["default"])
+
+    @staticmethod
+    def is_throttle(exc: Exception) -> bool:
+        if isinstance(exc, M2MError):
+            return exc.error_code in RATE_LIMIT_ERROR_CODES
+        if isinstance(exc, requests.HTTPError):
+            return exc.response is not None and exc.response.status_code == 429
+        if isinstance(exc, aiohttp.ClientResponseError):
+            return exc.status == 429
+        return False
+
+    def reserve(self, endpoint: str) -> float:
+        """Reserves a request slot for `endpoint` and returns the seconds to wait before sending it."""
+        with self._lock:
+            return self._bucket(endpoint).reserve()
+
+    def on_success(self, endpoint: str):
+        with self._lock:
+            bucket = self._bucket(endpoint)
+            bucket.rate = min(bucket.max_rate, bucket.rate + self.recovery_step)
+
+    def on_throttle(self, endpoint: str):
+        with self._lock:
+            bucket = self._bucket(endpoint)
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+            # Drop any accumulated burst so the slowdown takes effect immediately.
+            bucket.tokens = min(bucket.tokens, 0.0)
+        print(f"Rate limited on {endpoint}; slowing to {bucket.rate:.2f} requests/s.")
+
+    def current_rates(self) -> Dict[str, float]:
+        with self._lock:
+            return {family: bucket.rate for family, bucket in self._buckets.items()}
+
+
+class _M2MClientBase:
+    """Shared configuration and response handling for the sync and async M2M clients."""
+
+    def __init__(
+        self,
+        base_url: str = M2M_BASE_URL,
+        timeouts: Optional[Dict[str, tuple]] = None,
+        retry_policy: RetryPolicy = None,
+        rate_limiter: RateLimiter = None,
+    ):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.timeouts = dict(DEFAULT_M2M_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+    def timeout_for(self, endpoint: str):
+        return self.timeouts.get(endpoint, self.timeouts["default"])
+
+    def _connect_read_timeout(self, endpoint: str) -> tuple:
+        timeout = self.timeout_for(endpoint)
+        if isinstance(timeout, (int, float)):
+            return timeout, timeout
+        return tuple(timeout)
+
+    @staticmethod
+    def _headers(apiKey: str = None) -> dict:
+        return {"X-Auth-Token": apiKey} if apiKey else {}
+
+    def _retry_delay(self, endpoint: str, attempt: int, exc: Exception) -> Optional[float]:
+        """Returns how long to wait before retrying after failed `attempt`, or None to give up."""
+        if self.rate_limiter.is_throttle(exc):
+            self.rate_limiter.on_throttle(endpoint)
+        if attempt >= self.retry_policy.max_attempts or not self.retry_policy.is_retryable(exc):
+            return None
+        delay = self.retry_policy.delay(attempt)
+        print(f"{endpoint} attempt {attempt}/{self.retry_policy.max_attempts} failed ({str(exc)}); "
+              f"retrying in {delay:.1f}s.")
+        return delay
+
+    @staticmethod
+    def _parse_response(resp_json: dict):
+        if resp_json.get("errorCode"):
+            raise M2MError(resp_json.get("errorCode", "Unknown Error"), resp_json.get("errorMessage", ""))
+        return resp_json.get("data")
+
+
+class M2MClient(_M2MClientBase):
+    """Reusable client for the USGS M2M JSON API backed by a pooled, keep-alive HTTP session.
+
+    A single instance can be shared between many `download_landsat_tool` calls in the same process
+    so that metadata requests reuse warm TCP/TLS connections instead of paying the handshake each time.
+
+    Args:
+        base_url: The M2M API root. Defaults to the stable JSON endpoint.
+        pool_connections: Number of connection pools to cache (one per host).
+        pool_maxsize: Maximum number of connections kept alive per host.
+        timeouts: Mapping of endpoint name to a `(connect, read)` timeout tuple or a single number.
+            Missing endpoints fall back to the "default" entry.
+        retry_policy: `RetryPolicy` applied to every call. Defaults to `RetryPolicy()`.
+        rate_limiter: `RateLimiter` pacing every call. Defaults to `RateLimiter()`; share one
+            instance between clients to pace them together.
+    """
+
+    def __init__(
+        self,
+        base_url: str = M2M_BASE_URL,
+        pool_connections: int = 4,
+        pool_maxsize: int = 10,
+        timeouts: Optional[Dict[str, tuple]] = None,
+        retry_policy: RetryPolicy = None,
+        rate_limiter: RateLimiter = None,
+    ):
+        super().__init__(base_url, timeouts, retry_policy, rate_limiter)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+
+    def request(self, endpoint: str, payload: dict, apiKey: str = None):
+        """POSTs `payload` to `endpoint` and returns the `data` member of the M2M response.
+
+        Calls are paced by `rate_limiter` and transient failures are retried according to `retry_policy`."""
+        attempt = 0
+        while True:
+            attempt += 1
+            time.sleep(self.rate_limiter.reserve(endpoint))
+            try:
+                data = self._request_once(endpoint, payload, apiKey)
+            except Exception as e:
+                delay = self._retry_delay(endpoint, attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+            else:
+                self.rate_limiter.on_success(endpoint)
+                return data
+
+    def _request_once(self, endpoint: str, payload: dict, apiKey: str = None):
+        response = self.session.post(self.base_url + endpoint, json=payload, headers=self._headers(apiKey),
+                                     timeout=self._connect_read_timeout(endpoint))
+        response.raise_for_status()
+        return self._parse_response(response.json())
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AsyncM2MClient(_M2MClientBase):
+    """`aiohttp`-based M2M client for use inside an event loop (see `download_landsat_async`).
+
+    The underlying `aiohttp.ClientSession` is created lazily on first use, so the client must be
+    used and closed on the same event loop.
+
+    Args:
+        base_url: The M2M API root. Defaults to the stable JSON endpoint.
+        pool_maxsize: Maximum number of simultaneous keep-alive connections.
+        timeouts: Mapping of endpoint name to a `(connect, read)` timeout tuple or a single number.
+        keepalive_timeout: Seconds an idle connection is kept open for reuse.
+        retry_policy: `RetryPolicy` applied to every call. Defaults to `RetryPolicy()`.
+        rate_limiter: `RateLimiter` pacing every call. Defaults to `RateLimiter()`; share one
+            instance between clients to pace them together.
+    """
+
+    def __init__(
+        self,
+        base_url: str = M2M_BASE_URL,
+        pool_maxsize: int = 10,
+        timeouts: Optional[Dict[str, tuple]] = None,
+        keepalive_timeout: float = 60.0,
+        retry_policy: RetryPolicy = None,
+        rate_limiter: RateLimiter = None,
+    ):
+        super().__init__(base_url, timeouts, retry_policy, rate_limiter)
+        self.pool_maxsize = pool_maxsize
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def request(self, endpoint: str, payload: dict, apiKey: str = None):
+        """POSTs `payload` to `endpoint` and returns the `data` member of the M2M response.
+
+        Calls are paced by `rate_limiter` and transient failures are retried according to `retry_policy`."""
+        attempt = 0
+        while True:
+            attempt += 1
+            await asyncio.sleep(self.rate_limiter.reserve(endpoint))
+            try:
+                data = await self._request_once(endpoint, payload, apiKey)
+            except Exception as e:
+                delay = self._retry_delay(endpoint, attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                self.rate_limiter.on_success(endpoint)
+                return data
+
+    async def _request_once(self, endpoint: str, payload: dict, apiKey: str = None):
+        connect, read = self._connect_read_timeout(endpoint)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        async with self._get_session().post(self.base_url + endpoint, json=payload,
+                                            headers=self._headers(apiKey), timeout=timeout) as response:
+            response.raise_for_status()
+            resp_json = await response.json(content_type=None)
+        return self._parse_response(resp_json)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+M2M_API_KEY_LIFETIME = 2 * 3600  # Seconds an M2M API key stays valid after login-token
+
+
+class ApiKeyManager:
+    """Caches the M2M API key so it is reused across jobs (and optionally processes).
+
+    The key is kept in memory and, if `cache_file` is given, in a file readable only by the current
+    user so that other worker processes can pick it up instead of logging in themselves.  A new
+    `login-token` call is made only when no key is cached, the cached key is about to expire, or the
+    API rejected it (see `invalidate`).  `logout` is only sent from `close()`, which is registered
+    with `atexit` for the process-wide default manager.
+
+    Args:
+        username: M2M username. Defaults to the module-level `username` at login time.
+        token: M2M application token. Defaults to the module-level `token` at login time.
+        cache_file: Optional path of a JSON file used to share the key between processes.
+        key_lifetime: Seconds a key is considered valid after login.
+        expiry_margin: Keys are renewed this many seconds before `key_lifetime` elapses.
+        logout_on_close: Whether `close()` logs the key out.  Defaults to True unless the key is
+            shared through `cache_file`, since logging out would invalidate it for other processes.
+    """
+
+    def __init__(
+        self,
+        username: str = None,
+        token: str = None,
+        cache_file: str = None,
+        key_lifetime: float = M2M_API_KEY_LIFETIME,
+        expiry_margin: float = 300,
+        logout_on_close: bool = None,
+    ):
+        self.username = username
+        self.token = token
+        self.cache_file = cache_file
+        self.key_lifetime = key_lifetime
+        self.expiry_margin = expiry_margin
+        self.logout_on_close = (cache_file is None) if logout_on_close is None else logout_on_close
+        self._api_key: Optional[str] = None
+        self._expires = 0.0
+        self._rejected_keys = set()
+        self._loop_locks = weakref.WeakKeyDictionary()
+        # Each `download_landsat_tool` call runs its own event loop, so loop-local locks alone would
+        # let one login per thread through; this lock serializes logins across threads.
+        self._login_lock = threading.Lock()
+
+    def _credentials(self) -> Dict[str, str]:
+        return {"username": self.username or username, "token": self.token or token}
+
+    def _valid(self) -> bool:
+        return self._api_key is not None and time.time() < self._expires - self.expiry_margin
+
+    def _load_cache_file(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cached.get("apiKey") in self._rejected_keys:
+            return  # Written before the API rejected it; the next login overwrites it.
+        if cached.get("username") == self._credentials()["username"] and cached.get("expires", 0) > self._expires:
+            self._api_key = cached.get("apiKey")
+            self._expires = cached["expires"]
+
+    def _store_cache_file(self):
+        if not self.cache_file:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        fd = os.open(self.cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(self.cache_file, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"username": self._credentials()["username"], "apiKey": self._api_key,
+                       "expires": self._expires}, f)
+
+    def _lock_cache_file(self):
+        """Takes an exclusive inter-process lock so concurrent workers perform a single login."""
+        if not self.cache_file or fcntl is None:
+            return None
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        lock_file = open(self.cache_file + ".lock", "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _acquire_login_lock(self):
+        """Blocks until this thread may log in; returns the cache-file lock to pass to `_release_login_lock`."""
+        self._login_lock.acquire()
+        try:
+            return self._lock_cache_file()
+        except BaseException:
+            self._login_lock.release()
+            raise
+
+    def _release_login_lock(self, lock_file):
+        if lock_file is not None:
+            lock_file.close()
+        self._login_lock.release()
+
+    def _async_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._loop_locks.get(loop)
+        if lock is None:
+            lock = self._loop_locks[loop] = asyncio.Lock()
+        return lock
+
+    async def get_key(self, request: Callable[..., Awaitable]) -> str:
+        """Returns a valid API key, logging in through `request(endpoint, payload)` only if needed."""
+        if self._valid():
+            return self._api_key
+        async with self._async_lock():
+            if self._valid():
+                return self._api_key
+            acquiring = asyncio.ensure_future(asyncio.to_thread(self._acquire_login_lock))
+            try:
+                lock_file = await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The worker thread still takes the locks; release them once it has.
+                acquiring.add_done_callback(
+                    lambda done: done.exception() is None and self._release_login_lock(done.result()))
+                raise
+            try:
+                if self._valid():  # Another thread logged in while this one waited.
+                    return self._api_key
+                self._load_cache_file()
+                if self._valid():
+                    print("Reusing cached M2M API key.")
+                    return self._api_key
+                self._api_key = await request("login-token", self._credentials())
+                self._expires = time.time() + self.key_lifetime
+                self._store_cache_file()
+                print("Login successful.")
+                return self._api_key
+            finally:
+                self._release_login_lock(lock_file)
+
+    def invalidate(self, api_key: str):
+        """Forgets `api_key` after the API rejected it, so the next `get_key` logs in again.
+
+        The key is also ignored if it is still in `cache_file`; the new login replaces it there.
+        """
+        self._rejected_keys.add(api_key)
+        if api_key == self._api_key:
+            self._api_key = None
+            self._expires = 0.0
+
+    def close(self, client: M2MClient = None):
+        """Logs the cached key out (if `logout_on_close`) and forgets it."""
+        if self._api_key is not None and self.logout_on_close:
+            owns_client = client is None
+            if owns_client:
+                client = M2MClient()
+            try:
+                client.request("logout", {}, self._api_key)
+                print("Logged out.")
+            except Exception as e:
+                print(f"Logout failed: {str(e)}")
+            finally:
+                if owns_client:
+                    client.close()
+        self._api_key = None
+        self._expires = 0.0
+
+
+_default_api_key_manager: Optional[ApiKeyManager] = None
+
+
+def get_default_api_key_manager() -> ApiKeyManager:
+    """Returns the process-wide `ApiKeyManager`, which logs out when the interpreter exits."""
+    global _default_api_key_manager
+    if _default_api_key_manager is None:
+        _default_api_key_manager = ApiKeyManager()
+        atexit.register(_default_api_key_manager.close)
+    return _default_api_key_manager
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "landsat_m2m")
+
+
+class SceneSearchCache:
+    """Persistent single-file (SQLite) cache of `scene-search` responses.
+
+    Entries are keyed by a canonical hash of the dataset and scene filter (spatial filter,
+    acquisition window, cloud cover filter), expire after `ttl_seconds`, and the least recently
+    used entries are evicted once more than `max_entries` are stored.  Hit/miss counters are kept
+    both on the instance (for the current process) and in the database (across runs).
+
+    Args:
+        path: Location of the SQLite file. Parent directories are created if needed.
+        ttl_seconds: How long a cached response stays valid. Defaults to one day.
+        max_entries: Maximum number of cached responses kept on disk.
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(DEFAULT_CACHE_DIR, "scene_search.sqlite"),
+        ttl_seconds: float = 24 * 3600,
+        max_entries: int = 1000,
+    ):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache "
+                "(key TEXT PRIMARY KEY, created REAL NOT NULL, last_used REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_used ON search_cache (last_used)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @staticmethod
+    def make_key(dataset: str, scene_filter: dict, max_scenes: int = None) -> str:
+        """Returns a stable hash for a search, independent of dict ordering."""
+        query = {"datasetName": dataset, "sceneFilter": scene_filter}
+        if max_scenes is not None:
+            query["maxScenes"] = max_scenes
+        canonical = json.dumps(query, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _count(self, name: str):
+        self._conn.execute(
+            "INSERT INTO cache_stats (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the cached response data for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT created, data FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[0] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self.misses += 1
+                self._count("misses")
+                return None
+            self._conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            self._count("hits")
+            return json.loads(row[1])
+
+    def put(self, key: str, data: dict):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, created, last_used, data) VALUES (?, ?, ?, ?)",
+                (key, now, now, json.dumps(data)),
+            )
+            self._conn.execute("DELETE FROM search_cache WHERE created < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key IN "
+                "(SELECT key FROM search_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the persistent hit/miss counters and the current number of entries."""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM cache_stats").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": entries}
+
+    def close(self):
+        self._conn.close()
+
+
+def _scene_path_row_date(display_id: str) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    """Extracts (path, row, acquisition date) from a product ID like "LC08_L2SP_042035_20220115_..."."""
+    parts = display_id.split("_")
+    if len(parts) < 4 or len(parts[2]) != 6 or not parts[2].isdigit() or len(parts[3]) != 8:
+        return None, None, None
+    acquired = f"{parts[3][:4]}-{parts[3][4:6]}-{parts[3][6:]}"
+    return int(parts[2][:3]), int(parts[2][3:]), acquired
+
+
+class SceneCatalog:
+    """Persistent local catalog (SQLite) of `scene-search` results with incremental sync.
+
+    Scenes are stored once, indexed by entityId, displayId, acquisition date, path/row and cloud
+    cover, and linked to the AOI queries that returned them.  For every AOI query (dataset, location
+    filter and cloud cover limit) the catalog records the acquisition range already synced, so a
+    later job only asks the M2M API for dates outside that range and answers the rest locally.
+
+    Args:
+        path: Location of the SQLite file. Parent directories are created if needed.
+        resync_days: Days before the synced high-water mark that are queried again on every sync,
+            to pick up scenes that were processed and published some time after acquisition.
+    """
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "scene_catalog.sqlite"), resync_days: int = 30):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.resync_days = resync_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS scenes (
+                    entity_id TEXT PRIMARY KEY,
+                    display_id TEXT NOT NULL,
+                    dataset TEXT NOT NULL,
+                    acquisition_date TEXT,
+                    path INTEGER,
+                    row INTEGER,
+                    cloud_cover REAL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_scenes_display_id ON scenes (display_id);
+                CREATE INDEX IF NOT EXISTS idx_scenes_acquisition_date ON scenes (acquisition_date);
+                CREATE INDEX IF NOT EXISTS idx_scenes_path_row ON scenes (path, row);
+                CREATE INDEX IF NOT EXISTS idx_scenes_cloud_cover ON scenes (cloud_cover);
+                CREATE TABLE IF NOT EXISTS aoi_scenes (
+                    aoi_key TEXT NOT NULL,
+                    entity_id TEXT NOT NULL,
+                    PRIMARY KEY (aoi_key, entity_id)
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    aoi_key TEXT PRIMARY KEY,
+                    synced_start TEXT NOT NULL,
+                    synced_end TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+            """)
+
+    @staticmethod
+    def make_aoi_key(dataset: str, location_filter: dict, max_cloud_cover: float) -> str:
+        canonical = json.dumps({"datasetName": dataset, "location": location_filter, "maxCloud": max_cloud_cover},
+                               sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def missing_ranges(self, aoi_key: str, start_date: str, end_date: str) -> List[Tuple[str, str]]:
+        """Returns the acquisition ranges to fetch from the API before `start_date`..`end_date` can be
+        answered locally.  Ranges are widened to touch the synced range so it stays contiguous, and
+        the last `resync_days` before the high-water mark are always fetched again."""
+        with self._lock:
+            row = self._conn.execute("SELECT synced_start, synced_end FROM sync_state WHERE aoi_key = ?",
+                                     (aoi_key,)).fetchone()
+        if row is None:
+            return [(start_date, end_date)]
+        synced_start, synced_end = row
+        trusted_end = max(synced_start, (datetime.strptime(synced_end, "%Y-%m-%d").date()
+                                         - timedelta(days=self.resync_days)).isoformat())
+        ranges = []
+        if start_date < synced_start:
+            ranges.append((start_date, synced_start))
+        if end_date > trusted_end:
+            ranges.append((min(max(start_date, trusted_end), synced_end), end_date))
+        return ranges
+
+    def add_scenes(self, aoi_key: str, dataset: str, scenes: List[dict]):
+        rows, links = [], []
+        for scene in scenes:
+            entity_id, display_id = scene.get("entityId"), scene.get("displayId")
+            if not entity_id or not display_id:
+                continue
+            path, row, acquired = _scene_path_row_date(display_id)
+            try:
+                cloud_cover = float(scene.get("cloudCover"))
+            except (TypeError, ValueError):
+                cloud_cover = None
+            rows.append((entity_id, display_id, dataset, acquired, path, row, cloud_cover, json.dumps(scene)))
+            links.append((aoi_key, entity_id))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR IGNORE INTO aoi_scenes VALUES (?, ?)", links)
+
+    def mark_synced(self, aoi_key: str, start_date: str, end_date: str):
+        """Extends the synced range of `aoi_key`; the high-water mark never moves past today."""
+        end_date = min(end_date, date.today().isoformat())
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT synced_start, synced_end FROM sync_state WHERE aoi_key = ?",
+                                     (aoi_key,)).fetchone()
+            if row is not None:
+                start_date, end_date = min(start_date, row[0]), max(end_date, row[1])
+            self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                               (aoi_key, start_date, end_date, time.time()))
+
+    def query(self, aoi_key: str, start_date: str, end_date: str, max_cloud_cover: float = None) -> List[dict]:
+        """Returns catalogued scenes of `aoi_key` acquired between the dates, oldest first."""
+        sql = ("SELECT s.data FROM scenes s JOIN aoi_scenes a ON a.entity_id = s.entity_id "
+               "WHERE a.aoi_key = ? AND s.acquisition_date BETWEEN ? AND ?")
+        params = [aoi_key, start_date, end_date]
+        if max_cloud_cover is not None:
+            sql += " AND (s.cloud_cover IS NULL OR s.cloud_cover <= ?)"
+            params.append(max_cloud_cover)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY s.acquisition_date, s.display_id", params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+class DownloadManifest:
+    """Record of completed downloads kept in the output directory, so reruns skip finished files.
+
+    Entries (entityId, productId, final path, size, SHA-256 checksum, completion time) are appended
+    as JSON lines to `.landsat_download_manifest.jsonl`; the latest entry per entityId wins.  An
+    entry only counts as complete while its final path still exists with the recorded size.
+    """
+
+    FILENAME = ".landsat_download_manifest.jsonl"
+
+    def __init__(self, output_directory: str):
+        self.path = os.path.join(output_directory, self.FILENAME)
+        self.entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Ignore a line truncated by an interrupted run.
+                    if entry.get("entityId"):
+                        self.entries[entry["entityId"]] = entry
+
+    def is_complete(self, entity_id: str) -> bool:
+        entry = self.entries.get(entity_id)
+        if entry is None or not os.path.exists(entry["path"]):
+            return False
+        return entry.get("size") is None or os.path.isdir(entry["path"]) or os.path.getsize(entry["path"]) == entry["size"]
+
+    def pending(self, downloads: List[dict]) -> List[dict]:
+        """Returns the download-request items whose entityId has not been completed yet."""
+        return [item for item in downloads if not self.is_complete(item.get("entityId"))]
+
+    def record(self, entity_id: str, product_id: str, path: str, size: int = None, checksum: str = None):
+        entry = {"entityId": entity_id, "productId": product_id, "path": os.path.abspath(path), "size": size,
+                 "sha256": checksum, "completed": datetime.now().isoformat(timespec="seconds")}
+        with self._lock:
+            self.entries[entity_id] = entry
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class DownloadRegistry:
+    """Tracks every requested file through its download states.
+
+    States move from "requested" to "preparing" (the server is staging the file), "available" (a
+    URL is known), "downloading", and finally "done" or "failed".  `offer` deduplicates URLs that
+    `download-request` / `download-retrieve` report repeatedly, so each file is queued exactly once.
+
+    There is one record per file, keyed by entityId.  `download-request` items often carry only a
+    downloadId; those are held aside until `download-retrieve` reports the entityId as well, at
+    which point the downloadId is linked to the file's record.  Failed items may be given by
+    productId instead, which is mapped back to the requested entityId.  All counts are taken from
+    the records, so a file is never counted twice.
+    """
+
+    REQUESTED = "requested"
+    PREPARING = "preparing"
+    AVAILABLE = "available"
+    DOWNLOADING = "downloading"
+    DONE = "done"
+    FAILED = "failed"
+    WAITING_STATES = (REQUESTED, PREPARING)
+
+    def __init__(self, requested: List[dict]):
+        self.states: Dict[str, str] = {}
+        self.items: Dict[str, dict] = {}
+        self._entity_of_product: Dict[str, str] = {}
+        self._entity_of_download: Dict[str, str] = {}
+        self._unlinked: set = set()  # downloadIds reported as preparing before their entityId was known
+        for item in requested:
+            if item.get("entityId"):
+                self.states[item["entityId"]] = self.REQUESTED
+                if item.get("productId") is not None:
+                    self._entity_of_product[str(item["productId"])] = item["entityId"]
+
+    def key(self, item) -> Optional[str]:
+        """Returns the record key of a download item (a dict, or a bare productId).
+
+        Items naming both a downloadId and an entityId link the two, so later items that carry
+        only the downloadId resolve to the same record.
+        """
+        if not isinstance(item, dict):
+            item = {"productId": item}
+        entity_id = item.get("entityId") or self._entity_of_product.get(str(item.get("productId")))
+        download_key = f"download:{item['downloadId']}" if item.get("downloadId") is not None else None
+        if entity_id and download_key and download_key not in self._entity_of_download:
+            self._entity_of_download[download_key] = entity_id
+            if download_key in self._unlinked:
+                self._unlinked.discard(download_key)
+                if self.states.get(entity_id, self.REQUESTED) == self.REQUESTED:
+                    self.states[entity_id] = self.PREPARING
+        if entity_id:
+            return entity_id
+        if download_key:
+            return self._entity_of_download.get(download_key, download_key)
+        return item.get("url")
+
+    def _record(self, item) -> Optional[str]:
+        """Returns the key of the file's record, or None while the item cannot be attributed to a file."""
+        key = self.key(item)
+        if key in self.states or (isinstance(item, dict) and item.get("entityId")):
+            return key
+        return None
+
+    def _hold(self, item: dict):
+        if item.get("downloadId") is not None:
+            self._unlinked.add(f"download:{item['downloadId']}")
+
+    def mark_preparing(self, items: List[dict]):
+        for item in items:
+            key = self._record(item)
+            if key is None:
+                self._hold(item)
+            elif self.states.get(key, self.REQUESTED) == self.REQUESTED:
+                self.states[key] = self.PREPARING
+
+    def mark_failed(self, items: list):
+        """Marks files that `download-request` rejected, so nobody waits for their URLs."""
+        for item in items:
+            key = self._record(item)
+            if key is not None:
+                self.states[key] = self.FAILED
+
+    def offer(self, item: dict) -> bool:
+        """Registers an available download; returns False if it has no URL or is already known.
+
+        An item without an entityId (as `download-request` returns them) is held aside: the file
+        name and manifest entry depend on the entityId, which `download-retrieve` supplies.
+        """
+        if not item.get("url"):
+            return False
+        key = self._record(item)
+        if not item.get("entityId"):
+            if key is None:
+                self._hold(item)
+            elif self.states[key] in self.WAITING_STATES:
+                self.states[key] = self.PREPARING
+            return False
+        if self.states.get(key) not in (None,) + self.WAITING_STATES:
+            return False
+        self.states[key] = self.AVAILABLE
+        self.items[key] = item
+        return True
+
+    def refresh(self, item: dict) -> bool:
+        """Replaces the stored item for a file that is already known, e.g. with a newly signed URL."""
+        key = self.key(item)
+        if key not in self.items or not item.get("url"):
+            return False
+        self.items[key] = item
+        return True
+
+    def set_state(self, item: dict, state: str):
+        key = self._record(item)
+        if key is not None:
+            self.states[key] = state
+
+    def count(self, *states: str) -> int:
+        return sum(1 for state in self.states.values() if state in states)
+
+    def waiting(self) -> int:
+        """Number of requested files that have neither a URL nor failed yet."""
+        return self.count(*self.WAITING_STATES)
+
+    def summary(self) -> Dict[str, int]:
+        summary: Dict[str, int] = {}
+        for state in self.states.values():
+            summary[state] = summary.get(state, 0) + 1
+        return summary
+
+
+DOWNLOAD_ORDERS = ("fifo", "largest_first", "acquisition_date", "by_scene")
+
+
+class DownloadScheduler:
+    """Queue of available downloads, handed out in the order of a scheduling policy.
+
+    Policies: "fifo" keeps the order in which URLs become available; "largest_first" starts the
+    biggest files first (by `filesize` from download-options) so no giant transfer is left for the
+    end of the job; "acquisition_date" goes from the oldest to the newest acquisition; "by_scene"
+    finishes the files of one scene before starting the next, so complete scenes appear early.
+    Only files whose URL is already available can be reordered.  `None` is the end-of-stream
+    marker and always sorts last.
+
+    The queue is unbounded so that queueing never blocks the poller: it only holds references to
+    items the `DownloadRegistry` keeps anyway, while the number of running transfers is bounded by
+    the download workers.
+    """
+
+    def __init__(self, order: str = "fifo"):
+        if order not in DOWNLOAD_ORDERS:
+            raise ValueError(f"Invalid download_order {order!r}; use one of {', '.join(DOWNLOAD_ORDERS)}.")
+        self.order = order
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._sequence = 0
+        self._files: Dict[str, tuple] = {}
+        self._scene_rank: Dict[str, int] = {}
+
+    def describe(self, entity_id: str, size=None, acquired: Optional[str] = None, scene: Optional[str] = None):
+        """Records what the policies know about a file before its URL is available."""
+        scene = scene or entity_id
+        rank = self._scene_rank.setdefault(scene, len(self._scene_rank))
+        self._files[entity_id] = (int(size or 0), acquired or "", rank)
+
+    def priority(self, item: dict) -> tuple:
+        size, acquired, rank = self._files.get(item.get("entityId"), (0, "", len(self._scene_rank)))
+        if self.order == "largest_first":
+            return (-size,)
+        if self.order == "acquisition_date":
+            return acquired, rank
+        if self.order == "by_scene":
+            return (rank,)
+        return ()
+
+    def sort(self, items: List[dict]) -> List[dict]:
+        return sorted(items, key=self.priority)
+
+    def _entry(self, item: Optional[dict]) -> tuple:
+        self._sequence += 1
+        if item is None:
+            return (1,), self._sequence, None
+        return (0,) + self.priority(item), self._sequence, item
+
+    async def put(self, item: Optional[dict]):
+        await self._queue.put(self._entry(item))
+
+    def put_nowait(self, item: Optional[dict]):
+        self._queue.put_nowait(self._entry(item))
+
+    async def get(self) -> Optional[dict]:
+        return (await self._queue.get())[2]
+
+
+def _sensor_from_display_id(display_id: str) -> Optional[str]:
+    """Returns the sensor key ("L8", "L9", ...) encoded in a Landsat product ID such as "LC09_L2SP_...".
+
+    Characters 3-4 of a Collection 2 product ID are the zero-padded spacecraft number.
+    """
+    spacecraft = display_id[2:4]
+    return f"L{int(spacecraft)}" if spacecraft.isdigit() else None
+
+
+SCENE_SEARCH_PAGE_SIZE = 1000  # maxResults requested per scene-search page
+
+
+async def _scene_search_all(
+    call: Callable[..., Awaitable],
+    dataset: str,
+    scene_filter: dict,
+    max_scenes: int = None,
+    page_size: int = SCENE_SEARCH_PAGE_SIZE,
+) -> List[dict]:
+    """Runs a paginated `scene-search` and returns the results of every page, in order.
+
+    The first page reveals `totalHits`; the remaining pages are then requested concurrently
+    through `call(endpoint, payload)`.  At most `max_scenes` results are returned if given.
+    """
+    first_size = page_size if max_scenes is None else min(page_size, max_scenes)
+    first = await call("scene-search", {"datasetName": dataset, "sceneFilter": scene_filter,
+                                        "maxResults": first_size, "startingNumber": 1})
+    first = first or {}
+    results = list(first.get("results", []))
+    total = first.get("totalHits") or len(results)
+    wanted = total if max_scenes is None else min(total, max_scenes)
+    if len(results) >= wanted or not first.get("nextRecord") or not results:
+        return results[:wanted]
+
+    # The server may cap maxResults below what we asked for, so step by what it actually returned.
+    step = len(results)
+
+    async def _fetch_page(start: int) -> List[dict]:
+        page = await call("scene-search", {"datasetName": dataset, "sceneFilter": scene_filter,
+                                           "maxResults": min(step, wanted - start + 1), "startingNumber": start})
+        return (page or {}).get("results", [])
+
+    pages = await asyncio.gather(*[_fetch_page(start) for start in range(step + 1, wanted + 1, step)])
+    for page in pages:
+        results.extend(page)
+    return results[:wanted]
+
+
+def _plan_acquisition_windows(start_date: str, end_date: str, window: Union[str, int] = None) -> List[Tuple[str, str]]:
+    """Splits the inclusive `start_date`..`end_date` range into consecutive acquisition windows.
+
+    `window` is "month" or "year" (calendar-aligned windows) or a number of days.  With no window
+    the whole range is returned as a single window.  Raises ValueError for an unknown window.
+    """
+    if not window:
+        return [(start_date, end_date)]
+    if window not in ("month", "year") and not (isinstance(window, int) and window > 0):
+        raise ValueError(f"Invalid search window {window!r}; use 'month', 'year' or a positive number of days.")
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    windows = []
+    while start <= end:
+        if window == "year":
+            next_start = date(start.year + 1, 1, 1)
+        elif window == "month":
+            next_start = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        else:
+            next_start = start + timedelta(days=window)
+        windows.append((start.isoformat(), min(end, next_start - timedelta(days=1)).isoformat()))
+        start = next_start
+    return windows
+
+
+def _merge_scene_results(result_lists: List[List[dict]]) -> List[dict]:
+    """Concatenates scene-search results, dropping repeated entityIds (first occurrence wins)."""
+    seen = set()
+    merged = []
+    for results in result_lists:
+        for scene in results:
+            entity_id = scene.get("entityId")
+            if entity_id in seen:
+                continue
+            seen.add(entity_id)
+            merged.append(scene)
+    return merged
+
+
+def _parse_bounding_box(bounding_box: str) -> List[dict]:
+    """Parses "min_lon,min_lat,max_lon,max_lat" into one GeoJSON Polygon, or two if the box crosses
+    the antimeridian (min_lon > max_lon).  Raises ValueError for malformed or out-of-range boxes."""
+    min_lon, min_lat, max_lon, max_lat = map(float, bounding_box.split(","))
+    if not (-180 <= min_lon <= 180 and -90 <= min_lat <= 90 and -180 <= max_lon <= 180 and -90 <= max_lat <= 90):
+        raise ValueError("bounding_box coordinates out of range")
+    if min_lat > max_lat:
+        raise ValueError("min_lat is greater than max_lat")
+    spans = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    return [{
+        "type": "Polygon",
+        "coordinates": [[[west, min_lat], [east, min_lat], [east, max_lat], [west, max_lat], [west, min_lat]]],
+    } for west, east in spans]
+
+
+def _load_aoi_file(path: str) -> dict:
+    """Reads an AOI file as GeoJSON.  GeoJSON files are read directly; other formats (shapefile,
+    GeoPackage, ...) require the optional `geopandas` package and are reprojected to WGS84."""
+    if path.lower().endswith((".geojson", ".json")):
+        with open(path) as f:
+            return json.load(f)
+    try:
+        import geopandas
+    except ImportError:
+        raise ValueError(f"Reading '{path}' requires geopandas; install it or convert the AOI to GeoJSON.")
+    frame = geopandas.read_file(path)
+    if frame.crs is not None:
+        frame = frame.to_crs(epsg=4326)
+    return frame.__geo_interface__
+
+
+def _aoi_polygons(geojson: dict) -> List[list]:
+    """Returns the coordinate arrays of every Polygon in a GeoJSON geometry, Feature or FeatureCollection."""
+    geo_type = geojson.get("type")
+    if geo_type == "Polygon":
+        return [geojson["coordinates"]]
+    if geo_type == "MultiPolygon":
+        return list(geojson["coordinates"])
+    if geo_type == "Feature":
+        return _aoi_polygons(geojson.get("geometry") or {})
+    if geo_type == "FeatureCollection":
+        return [polygon for feature in geojson.get("features", []) for polygon in _aoi_polygons(feature)]
+    if geo_type == "GeometryCollection":
+        return [polygon for geometry in geojson.get("geometries", []) for polygon in _aoi_polygons(geometry)]
+    raise ValueError(f"Unsupported AOI geometry type '{geo_type}'; use Polygon or MultiPolygon.")
+
+
+def _simplify_line(points: List[list], tolerance: float) -> List[list]:
+    """Douglas-Peucker simplification of a vertex list, keeping both end points."""
+    if len(points) < 3:
+        return points
+    (x1, y1), (x2, y2) = points[0][:2], points[-1][:2]
+    dx, dy = x2 - x1, y2 - y1
+    length = (dx * dx + dy * dy) ** 0.5
+    max_distance, index = -1.0, 0
+    for i in range(1, len(points) - 1):
+        px, py = points[i][:2]
+        if length == 0:
+            distance = ((px - x1) ** 2 + (py - y1) ** 2) ** 0.5
+        else:
+            distance = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+        if distance > max_distance:
+            max_distance, index = distance, i
+    if max_distance <= tolerance:
+        return [points[0], points[-1]]
+    return _simplify_line(points[:index + 1], tolerance)[:-1] + _simplify_line(points[index:], tolerance)
+
+
+def _simplify_ring(ring: List[list], tolerance: float) -> List[list]:
+    """Simplifies a closed linear ring; rings that would collapse below a triangle are kept as-is."""
+    if tolerance <= 0 or len(ring) <= 4:
+        return ring
+    # Split the ring at its farthest vertex from the start so the closing point is not a fixed anchor.
+    x0, y0 = ring[0][:2]
+    far = max(range(len(ring)), key=lambda i: (ring[i][0] - x0) ** 2 + (ring[i][1] - y0) ** 2)
+    simplified = _simplify_line(ring[:far + 1], tolerance)[:-1] + _simplify_line(ring[far:], tolerance)
+    return simplified if len(simplified) >= 4 else ring
+
+
+def _resolve_aoi(
+    bounding_box: str = None,
+    aoi_geojson: Union[dict, str] = None,
+    aoi_feature_class: str = None,
+    simplify_tolerance: float = 0.0,
+) -> List[dict]:
+    """Builds the list of GeoJSON Polygons to search from whichever AOI inputs were given.
+
+    Each polygon becomes its own `scene-search` spatial filter; results are merged by entityId.
+    """
+    polygons = []
+    if bounding_box:
+        polygons.extend(polygon["coordinates"] for polygon in _parse_bounding_box(bounding_box))
+    if aoi_geojson:
+        polygons.extend(_aoi_polygons(json.loads(aoi_geojson) if isinstance(aoi_geojson, str) else aoi_geojson))
+    if aoi_feature_class:
+        polygons.extend(_aoi_polygons(_load_aoi_file(aoi_feature_class)))
+    if not polygons:
+        raise ValueError("The AOI does not contain any polygons.")
+    return [{"type": "Polygon", "coordinates": [_simplify_ring(ring, simplify_tolerance) for ring in rings]}
+            for rings in polygons]
+
+
+def _point_in_ring(x: float, y: float, ring: List[list]) -> bool:
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+def _segments_cross(a, b, c, d) -> bool:
+    def orient(p, q, r):
+        return (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+    o1, o2, o3, o4 = orient(a, b, c), orient(a, b, d), orient(c, d, a), orient(c, d, b)
+    if o1 == o2 == o3 == o4 == 0:
+        # Collinear: they only touch if their extents overlap on both axes.
+        return all(max(min(a[i], b[i]), min(c[i], d[i])) <= min(max(a[i], b[i]), max(c[i], d[i]))
+                   for i in (0, 1))
+    return (o1 * o2 <= 0) and (o3 * o4 <= 0)
+
+
+def _rings_intersect(ring_a: List[list], ring_b: List[list]) -> bool:
+    """True if two simple polygons (outer rings only) overlap or touch."""
+    ring_a = [tuple(point[:2]) for point in ring_a]
+    ring_b = [tuple(point[:2]) for point in ring_b]
+    if _point_in_ring(*ring_a[0], ring_b) or _point_in_ring(*ring_b[0], ring_a):
+        return True
+    edges_b = list(zip(ring_b, ring_b[1:] + ring_b[:1]))
+    return any(_segments_cross(a1, a2, b1, b2)
+               for a1, a2 in zip(ring_a, ring_a[1:] + ring_a[:1]) for b1, b2 in edges_b)
+
+
+WRS2_INDEX_MAGIC = b"WRS2IDX1"
+DEFAULT_WRS2_INDEX_PATH = os.path.join(DEFAULT_CACHE_DIR, "wrs2_descending.bin")
+
+
+class WRS2Index:
+    """Compact in-memory index of WRS-2 descending path/row footprints.
+
+    Each footprint is stored as its four corners in centidegrees (int16), so the ~28,000 tiles fit
+    in a few hundred kilobytes.  The index file is produced once from the USGS WRS-2 descending
+    shapefile with `WRS2Index.build` and loaded lazily.  Lookups prefilter every tile by bounding
+    box in one vectorized pass (numpy, if installed) and run an exact polygon test on the few
+    candidates left.
+
+    Args:
+        paths, rows: Path and row number per tile.
+        corner_lons, corner_lats: Four corner coordinates per tile in centidegrees, tile-major.
+    """
+
+    def __init__(self, paths: array, rows: array, corner_lons: array, corner_lats: array):
+        self.paths = paths
+        self.rows = rows
+        self.corner_lons = corner_lons
+        self.corner_lats = corner_lats
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_WRS2_INDEX_PATH) -> "WRS2Index":
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(WRS2_INDEX_MAGIC):
+            raise ValueError(f"{path} is not a WRS-2 index file.")
+        (count,) = struct.unpack_from("<I", data, len(WRS2_INDEX_MAGIC))
+        payload = zlib.decompress(data[len(WRS2_INDEX_MAGIC) + 4:])
+        paths, rows = array("B", payload[:count]), array("B", payload[count:2 * count])
+        corners = array("h", payload[2 * count:])
+        if struct.pack("=h", 1) != struct.pack("<h", 1):
+            corners.byteswap()
+        return cls(paths, rows, corners[:4 * count], corners[4 * count:])
+
+    def save(self, path: str):
+        corners = array("h", self.corner_lons) + array("h", self.corner_lats)
+        if struct.pack("=h", 1) != struct.pack("<h", 1):
+            corners.byteswap()
+        payload = bytes(self.paths) + bytes(self.rows) + corners.tobytes()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(WRS2_INDEX_MAGIC + struct.pack("<I", len(self.paths)) + zlib.compress(payload, 9))
+
+    @classmethod
+    def build(cls, shapefile: str, output_path: str = DEFAULT_WRS2_INDEX_PATH) -> "WRS2Index":
+        """Builds and saves the index from the USGS "WRS2_descending" shapefile (.shp/.dbf pair or .zip)."""
+        shp_bytes, dbf_bytes = _read_shapefile_parts(shapefile)
+        attributes = _read_dbf_records(dbf_bytes)
+        paths, rows, corner_lons, corner_lats = array("B"), array("B"), array("h"), array("h")
+        for record, ring in zip(attributes, _read_shp_polygons(shp_bytes)):
+            paths.append(int(record["PATH"]))
+            rows.append(int(record["ROW"]))
+            for lon, lat in _quad_corners(ring):
+                corner_lons.append(round(lon * 100))
+                corner_lats.append(round(lat * 100))
+        index = cls(paths, rows, corner_lons, corner_lats)
+        index.save(output_path)
+        return index
+
+    def _tile_ring(self, i: int) -> List[list]:
+        lons = [self.corner_lons[4 * i + k] / 100 for k in range(4)]
+        if max(lons) - min(lons) > 180:  # Tile straddles the antimeridian; unwrap to 0..360.
+            lons = [lon + 360 if lon < 0 else lon for lon in lons]
+        return [[lon, self.corner_lats[4 * i + k] / 100] for k, lon in enumerate(lons)]
+
+    def _compute_bounds(self):
+        count = len(self.paths)
+        if np is not None:
+            lons = np.asarray(self.corner_lons, dtype=np.float64).reshape(count, 4) / 100
+            lats = np.asarray(self.corner_lats, dtype=np.float64).reshape(count, 4) / 100
+            wraps = (lons.max(axis=1) - lons.min(axis=1)) > 180
+            lons[wraps] = np.where(lons[wraps] < 0, lons[wraps] + 360, lons[wraps])
+            return lons.min(axis=1), lats.min(axis=1), lons.max(axis=1), lats.max(axis=1)
+        bounds = ([], [], [], [])
+        for i in range(count):
+            ring = self._tile_ring(i)
+            for target, value in zip(bounds, (min(p[0] for p in ring), min(p[1] for p in ring),
+                                              max(p[0] for p in ring), max(p[1] for p in ring))):
+                target.append(value)
+        return bounds
+
+    def _bbox_candidates(self, west: float, south: float, east: float, north: float) -> List[int]:
+        if self._bounds is None:
+            self._bounds = self._compute_bounds()
+        min_lon, min_lat, max_lon, max_lat = self._bounds
+        if np is not None:
+            # Tiles unwrapped to 0..360 are also tested against the AOI shifted by +360.
+            hits = (min_lat <= north) & (max_lat >= south) & (
+                ((min_lon <= east) & (max_lon >= west)) | ((min_lon <= east + 360) & (max_lon >= west + 360)))
+            return np.nonzero(hits)[0].tolist()
+        return [i for i in range(len(self.paths))
+                if min_lat[i] <= north and max_lat[i] >= south
+                and ((min_lon[i] <= east and max_lon[i] >= west)
+                     or (min_lon[i] <= east + 360 and max_lon[i] >= west + 360))]
+
+    def path_rows(self, polygon: dict) -> List[Tuple[int, int]]:
+        """Returns the sorted (path, row) pairs whose footprint intersects a GeoJSON Polygon."""
+        outer = polygon["coordinates"][0]
+        west, east = min(p[0] for p in outer), max(p[0] for p in outer)
+        south, north = min(p[1] for p in outer), max(p[1] for p in outer)
+        shifted = [[p[0] + 360, p[1]] for p in outer]
+        matches = set()
+        for i in self._bbox_candidates(west, south, east, north):
+            tile = self._tile_ring(i)
+            if _rings_intersect(outer, tile) or _rings_intersect(shifted, tile):
+                matches.add((self.paths[i], self.rows[i]))
+        return sorted(matches)
+
+
+def _read_shapefile_parts(shapefile: str) -> Tuple[bytes, bytes]:
+    if shapefile.lower().endswith(".zip"):
+        with zipfile.ZipFile(shapefile) as archive:
+            names = archive.namelist()
+            shp = next(name for name in names if name.lower().endswith(".shp"))
+            dbf = next(name for name in names if name.lower().endswith(".dbf"))
+            return archive.read(shp), archive.read(dbf)
+    stem = os.path.splitext(shapefile)[0]
+    with open(stem + ".shp", "rb") as shp, open(stem + ".dbf", "rb") as dbf:
+        return shp.read(), dbf.read()
+
+
+def _read_shp_polygons(data: bytes):
+    """Yields the first ring of every polygon record in an ESRI .shp file."""
+    offset = 100
+    while offset < len(data):
+        _, content_words = struct.unpack_from(">ii", data, offset)
+        content = offset + 8
+        shape_type = struct.unpack_from("<i", data, content)[0]
+        ring = []
+        if shape_type == 5:
+            num_parts, num_points = struct.unpack_from("<ii", data, content + 36)
+            parts = struct.unpack_from(f"<{num_parts}i", data, content + 44)
+            points_at = content + 44 + 4 * num_parts
+            end = parts[1] if num_parts > 1 else num_points
+            coords = struct.unpack_from(f"<{2 * end}d", data, points_at)
+            ring = [[coords[2 * k], coords[2 * k + 1]] for k in range(end)]
+        yield ring
+        offset = content + 2 * content_words
+
+
+def _read_dbf_records(data: bytes) -> List[Dict[str, str]]:
+    """Reads all records of a dBase III (.dbf) file as dicts of stripped strings."""
+    count, header_length, record_length = struct.unpack_from("<IHH", data, 4)
+    fields = []
+    position = 32
+    while data[position] != 0x0D:
+        name = data[position:position + 11].split(b"\x00")[0].decode("ascii")
+        fields.append((name, data[position + 16]))
+        position += 32
+    records = []
+    for r in range(count):
+        offset = header_length + r * record_length + 1  # Skip the deletion flag.
+        record = {}
+        for name, length in fields:
+            record[name] = data[offset:offset + length].decode("latin-1").strip()
+            offset += length
+        records.append(record)
+    return records
+
+
+def _quad_corners(ring: List[list]) -> List[Tuple[float, float]]:
+    """Reduces a footprint ring to four corners (extremes along both diagonals), in ring order."""
+    points = ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else ring
+    if max(p[0] for p in points) - min(p[0] for p in points) > 180:
+        points = [[p[0] + 360 if p[0] < 0 else p[0], p[1]] for p in points]
+    if len(points) == 4:
+        picks = range(4)
+    else:
+        picks = sorted({
+            max(range(len(points)), key=lambda k: points[k][0] + points[k][1]),
+            max(range(len(points)), key=lambda k: points[k][0] - points[k][1]),
+            min(range(len(points)), key=lambda k: points[k][0] + points[k][1]),
+            min(range(len(points)), key=lambda k: points[k][0] - points[k][1]),
+        })
+    corners = [(points[k][0] - 360 if points[k][0] > 180 else points[k][0], points[k][1]) for k in picks]
+    while len(corners) < 4:
+        corners.append(corners[-1])
+    return corners
+
+
+async def _wrs2_filter_ids(call: Callable[..., Awaitable], dataset: str) -> Optional[Tuple[str, str]]:
+    """Looks up the metadata filter IDs of the "WRS Path" and "WRS Row" fields of a dataset."""
+    filters = await call("dataset-filters", {"datasetName": dataset}) or []
+    ids = {}
+    for field in filters:
+        label = (field.get("fieldLabel") or "").strip().lower()
+        if label in ("wrs path", "wrs row"):
+            ids[label] = field.get("id")
+    if not ids.get("wrs path") or not ids.get("wrs row"):
+        return None
+    return ids["wrs path"], ids["wrs row"]
+
+
+def _wrs2_metadata_filter(filter_ids: Tuple[str, str], path: int, row: int) -> dict:
+    path_id, row_id = filter_ids
+    return {"filterType": "and", "childFilters": [
+        {"filterType": "between", "filterId": path_id, "firstValue": path, "secondValue": path},
+        {"filterType": "between", "filterId": row_id, "firstValue": row, "secondValue": row},
+    ]}
+
+
+DOWNLOAD_CHUNK_SIZE = 1 << 16  # Bytes read from the response per write
+PART_SUFFIX = ".part"
+
+
+class TransferStalledError(asyncio.TimeoutError):
+    """Raised when a file transfer delivers less than the configured minimum rate for too long."""
+
+
+class TransferConfig:
+    """HTTP settings for file transfers: connection pooling and timeouts.
+
+    There is deliberately no total timeout, so a large bundle may take as long as it needs while it
+    is progressing.  Instead, establishing a connection must not exceed `connect_timeout`, no single
+    read may wait longer than `sock_read_timeout` for data, and a transfer that receives fewer than
+    `stall_min_bytes` within any `stall_timeout` seconds is aborted as stalled (and retried).
+
+    Args:
+        limit: Maximum number of open connections in total; 0 means no limit.
+        limit_per_host: Maximum number of connections per host.  Segmented downloads need up to
+            `max_concurrent_downloads * download_segments` connections to one host; 0 means no limit.
+        ttl_dns_cache: Seconds that resolved host addresses are cached.
+        keepalive_timeout: Seconds an idle connection is kept open for reuse.
+        connect_timeout: Seconds allowed to connect to the host (not counting the wait for a pool slot).
+        sock_read_timeout: Seconds allowed between two reads from the socket.
+        stall_timeout: Length in seconds of the window in which `stall_min_bytes` must arrive.
+        stall_min_bytes: Minimum number of bytes per `stall_timeout` window.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 16,
+        ttl_dns_cache: int = 300,
+        keepalive_timeout: float = 30.0,
+        connect_timeout: float = 30.0,
+        sock_read_timeout: float = 120.0,
+        stall_timeout: float = 300.0,
+        stall_min_bytes: int = 1024 * 1024,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.sock_read_timeout = sock_read_timeout
+        self.stall_timeout = stall_timeout
+        self.stall_min_bytes = stall_min_bytes
+
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.sock_read_timeout)
+
+    def session(self) -> aiohttp.ClientSession:
+        """Creates a session with a connector tuned for long downloads from few hosts."""
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                         ttl_dns_cache=self.ttl_dns_cache, keepalive_timeout=self.keepalive_timeout)
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout())
+
+    def stall_watch(self) -> Callable[[int], None]:
+        """Returns a callback to feed with received byte counts; it raises `TransferStalledError`."""
+        window = [time.monotonic(), 0]
+
+        def _received(count: int):
+            window[1] += count
+            now = time.monotonic()
+            if now - window[0] >= self.stall_timeout:
+                if window[1] < self.stall_min_bytes:
+                    raise TransferStalledError(f"Transfer stalled: {window[1]} bytes in {now - window[0]:.0f}s.")
+                window[0], window[1] = now, 0
+
+        return _received
+
+
+DEFAULT_TRANSFER_CONFIG = TransferConfig()
+
+
+async def _iter_response_chunks(response: aiohttp.ClientResponse, transfer: TransferConfig):
+    """Yields the response body in chunks, aborting the transfer if it stalls."""
+    received = transfer.stall_watch()
+    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+        received(len(chunk))
+        yield chunk
+
+
+class AdaptiveConcurrencyLimiter:
+    """Async limit on concurrent transfers, adjusted by AIMD from measured throughput and errors.
+
+    Transfers hold a slot via `async with limiter:` and report received bytes with `record_bytes`
+    and transient failures with `record_error`.  Every `interval` seconds the measurement window is
+    evaluated: any error multiplies the limit by `decrease_factor`; otherwise, if all slots were busy
+    and throughput grew by at least `growth_threshold`, one slot is added, and an increase that made
+    throughput drop is undone.  With `minimum == maximum` (the default) the limit stays fixed.
+
+    Args:
+        initial: Starting number of concurrent transfers.
+        minimum: Lower bound for the limit (default `initial`).
+        maximum: Upper bound for the limit (default `initial`).
+        interval: Length of a measurement window in seconds.
+        decrease_factor: Multiplier applied to the limit after a window with errors.
+        growth_threshold: Relative throughput gain required to keep adding slots.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: Optional[int] = None,
+        maximum: Optional[int] = None,
+        interval: float = 5.0,
+        decrease_factor: float = 0.5,
+        growth_threshold: float = 0.05,
+    ):
+        self.minimum = max(1, minimum if minimum is not None else initial)
+        self.maximum = max(self.minimum, maximum if maximum is not None else initial)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.interval = interval
+        self.decrease_factor = decrease_factor
+        self.growth_threshold = growth_threshold
+        self.active = 0
+        self.total_bytes = 0
+        self.total_errors = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._started = time.monotonic()
+        self._window_start = self._started
+        self._window_bytes = 0
+        self._window_errors = 0
+        self._window_saturated = False
+        self._last_throughput = 0.0
+        self._last_increased = False
+        self.history: List[Tuple[float, int]] = [(0.0, self.limit)]
+
+    @property
+    def adaptive(self) -> bool:
+        return self.minimum < self.maximum
+
+    async def __aenter__(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+            self._window_saturated |= self.active >= self.limit
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.active -= 1
+            self._maybe_adjust()
+            self._condition.notify_all()
+
+    def record_bytes(self, count: int):
+        self.total_bytes += count
+        self._window_bytes += count
+
+    def record_error(self):
+        self.total_errors += 1
+        self._window_errors += 1
+
+    def _maybe_adjust(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if not self.adaptive or elapsed < self.interval or elapsed <= 0:
+            return
+        throughput = self._window_bytes / elapsed
+        limit, increased = self.limit, False
+        if self._window_errors:
+            limit = max(self.minimum, int(self.limit * self.decrease_factor))
+        elif self._last_increased and throughput < self._last_throughput:
+            limit = max(self.minimum, self.limit - 1)  # The extra transfer did not pay off.
+        elif self._window_saturated and throughput > 0 and \
+                throughput >= self._last_throughput * (1 + self.growth_threshold):
+            limit, increased = min(self.maximum, self.limit + 1), True
+        self._last_increased = increased and limit > self.limit
+        self._last_throughput = throughput
+        self._window_start, self._window_bytes, self._window_errors = now, 0, 0
+        self._window_saturated = self.active >= limit
+        if limit != self.limit:
+            self.limit = limit
+            self.history.append((round(now - self._started, 3), limit))
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "concurrency_history": list(self.history),
+            "final_concurrency": self.limit,
+            "bytes_downloaded": self.total_bytes,
+            "throughput_bytes_per_second": self.total_bytes / elapsed,
+            "transient_errors": self.total_errors,
+        }
+
+
+def _file_sha256(path: str, checksum=None):
+    """Feeds a file into a (new or given) SHA-256 object and returns it."""
+    checksum = checksum if checksum is not None else hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            checksum.update(block)
+    return checksum
+
+
+async def _fetch_to_file(
+    session: aiohttp.ClientSession,
+    url: str,
+    final_path: str,
+    attempts: int = 3,
+    progress: Optional[Callable[[int], None]] = None,
+    transfer: TransferConfig = DEFAULT_TRANSFER_CONFIG,
+) -> Tuple[int, str]:
+    """Downloads `url` to `final_path` through a resumable `<final_path>.part` file.
+
+    If a `.part` file is left over from an interrupted attempt (in this run or an earlier one) the
+    download continues from its size with an HTTP Range request, guarded by `If-Range` with the
+    ETag/Last-Modified stored next to it; servers that ignore the range restart from byte 0.  On
+    completion the file is atomically renamed into place.  `progress`, if given, is called with the
+    size of every received chunk.  Returns `(size, sha256 hex digest)`.
+    """
+    part_path = final_path + PART_SUFFIX
+    meta_path = part_path + ".json"
+    checksum, hashed = hashlib.sha256(), 0
+    for attempt in range(1, attempts + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset != hashed:
+            # Resuming a part written by an earlier run: hash what is already on disk once.
+            checksum, hashed = await asyncio.to_thread(_file_sha256, part_path), offset
+        validator = None
+        if offset and os.path.exists(meta_path):
+            try:
+                with open(meta_path) as f:
+                    part_meta = json.load(f)
+            except (OSError, ValueError):
+                part_meta = {}
+            if "segments" in part_meta:
+                # A preallocated segmented part has holes; its size says nothing about progress.
+                os.remove(part_path)
+                checksum, hashed, offset = hashlib.sha256(), 0, 0
+            validator = part_meta.get("validator")
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if validator:
+                headers["If-Range"] = validator
+        try:
+            async with session.get(url, headers=headers, timeout=transfer.timeout()) as response:
+                if response.status == 416 and offset:
+                    # Nothing left to send: either the part is already complete or it is stale.
+                    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                    if total.isdigit() and int(total) == offset:
+                        break
+                    os.remove(part_path)
+                    checksum, hashed = hashlib.sha256(), 0
+                    continue
+                response.raise_for_status()
+                if response.status != 206:
+                    offset = 0
+                    checksum, hashed = hashlib.sha256(), 0
+                validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                with open(meta_path, "w") as f:
+                    json.dump({"url": url, "validator": validator}, f)
+                async with aiofiles.open(part_path, "ab" if offset else "wb") as f:
+                    async for chunk in _iter_response_chunks(response, transfer):
+                        await f.write(chunk)
+                        checksum.update(chunk)
+                        hashed += len(chunk)
+                        if progress is not None:
+                            progress(len(chunk))
+            break
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == attempts:
+                raise
+            received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            print(f"Download of {os.path.basename(final_path)} interrupted at {received} bytes ({str(e)}); resuming.")
+    size = os.path.getsize(part_path)
+    os.replace(part_path, final_path)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    return size, checksum.hexdigest()
+
+
+async def _probe_ranges(
+    session: aiohttp.ClientSession,
+    url: str,
+    transfer: TransferConfig = DEFAULT_TRANSFER_CONFIG,
+) -> Optional[Tuple[int, Optional[str]]]:
+    """Returns `(content length, validator)` if the server honours byte ranges for `url`, else None."""
+    async with session.get(url, headers={"Range": "bytes=0-0"}, timeout=transfer.timeout()) as response:
+        response.raise_for_status()
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        if response.status != 206 or not total.isdigit():
+            return None
+        return int(total), response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+
+async def _fetch_segmented(
+    session: aiohttp.ClientSession,
+    url: str,
+    final_path: str,
+    segments: int,
+    min_segment_size: int,
+    progress: Optional[Callable[[int], None]] = None,
+    transfer: TransferConfig = DEFAULT_TRANSFER_CONFIG,
+) -> Tuple[int, str]:
+    """Downloads `url` as up to `segments` concurrent byte ranges written in place into a preallocated
+    `<final_path>.part` file.
+
+    Falls back to the single-stream `_fetch_to_file` when the server does not support ranges or the
+    file is smaller than two segments of `min_segment_size`.  Per-segment progress is saved next to
+    the part file, so an interrupted download resumes each segment where it stopped.  Each call makes
+    one attempt: when a segment fails the others are stopped and the error is raised, leaving retries
+    (and their backoff) to the caller.  Returns `(size, sha256 hex digest)`.
+    """
+    probe = await _probe_ranges(session, url, transfer)
+    count = min(segments, probe[0] // max(1, min_segment_size)) if probe else 0
+    if count < 2:
+        return await _fetch_to_file(session, url, final_path, 1, progress, transfer)
+    total, validator = probe
+    part_path = final_path + PART_SUFFIX
+    meta_path = part_path + ".json"
+
+    state = None
+    if os.path.exists(part_path) and os.path.exists(meta_path) and os.path.getsize(part_path) == total:
+        try:
+            with open(meta_path) as f:
+                part_meta = json.load(f)
+            if part_meta.get("total") == total and part_meta.get("validator") == validator:
+                state = part_meta.get("segments")
+        except (OSError, ValueError):
+            pass
+    if state is None:
+        bounds = [total * i // count for i in range(count + 1)]
+        # Each segment is [first byte, last byte, next byte to fetch].
+        state = [[bounds[i], bounds[i + 1] - 1, bounds[i]] for i in range(count)]
+        with open(part_path, "wb") as f:
+            f.truncate(total)
+
+    def _save_state():
+        with open(meta_path, "w") as f:
+            json.dump({"url": url, "validator": validator, "total": total, "segments": state}, f)
+
+    async def _fetch_segment(segment: list):
+        if segment[2] > segment[1]:
+            return
+        headers = {"Range": f"bytes={segment[2]}-{segment[1]}"}
+        if validator:
+            headers["If-Range"] = validator
+        async with session.get(url, headers=headers, timeout=transfer.timeout()) as response:
+            response.raise_for_status()
+            if response.status != 206:
+                raise ValueError(f"Server ignored the range request for {url} (file changed?).")
+            async with aiofiles.open(part_path, "r+b") as f:
+                await f.seek(segment[2])
+                async for chunk in _iter_response_chunks(response, transfer):
+                    await f.write(chunk)
+                    segment[2] += len(chunk)
+                    if progress is not None:
+                        progress(len(chunk))
+
+    _save_state()
+    tasks = [asyncio.create_task(_fetch_segment(segment)) for segment in state]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If one segment failed, stop the others before the part file is handed to a retry.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        _save_state()
+    checksum = (await asyncio.to_thread(_file_sha256, part_path)).hexdigest()
+    os.replace(part_path, final_path)
+    os.remove(meta_path)
+    return total, checksum
+
+
+def _compile_member_patterns(patterns: Optional[List[str]]) -> Optional["re.Pattern"]:
+    """Compiles glob patterns (e.g. "*_SR_B*.TIF") into one case-insensitive regex, or None if empty."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns), re.IGNORECASE)
+
+
+def _member_selected(name: str, include: Optional["re.Pattern"], exclude: Optional["re.Pattern"]) -> bool:
+    """Whether a tar member should be extracted; patterns match the full name or its basename."""
+    candidates = (name, os.path.basename(name))
+    if include is not None and not any(include.match(candidate) for candidate in candidates):
+        return False
+    return exclude is None or not any(exclude.match(candidate) for candidate in candidates)
+
+
+class _ResponseStreamReader:
+    """Blocking, read-only file object over an `aiohttp` response body, for use from a worker thread.
+
+    Each `read` schedules `response.content.read` on the event loop and waits for it, so a
+    synchronous consumer such as `tarfile` in stream mode can pull data straight off the socket.
+    Bytes passing through are counted and hashed, and reported to `progress` on the event loop.
+    A read raises `TransferStalledError` if the transfer falls below the stall threshold.
+    """
+
+    def __init__(self, response: aiohttp.ClientResponse, loop: asyncio.AbstractEventLoop,
+                 progress: Optional[Callable[[int], None]] = None,
+                 transfer: TransferConfig = DEFAULT_TRANSFER_CONFIG):
+        self.response = response
+        self.loop = loop
+        self.progress = progress
+        self.received = transfer.stall_watch()
+        self.size = 0
+        self.checksum = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = -1
+        data = asyncio.run_coroutine_threadsafe(self.response.content.read(size), self.loop).result()
+        self.size += len(data)
+        self.checksum.update(data)
+        self.received(len(data))
+        if self.progress is not None and data:
+            self.loop.call_soon_threadsafe(self.progress, len(data))
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+
+def _extract_tar_stream(fileobj, extract_dir: str, include: "re.Pattern" = None, exclude: "re.Pattern" = None):
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if _member_selected(member.name, include, exclude):
+                tar.extract(member, path=extract_dir)
+
+
+async def _stream_extract(
+    session: aiohttp.ClientSession,
+    url: str,
+    extract_dir: str,
+    include: "re.Pattern" = None,
+    exclude: "re.Pattern" = None,
+    progress: Optional[Callable[[int], None]] = None,
+    transfer: TransferConfig = DEFAULT_TRANSFER_CONFIG,
+) -> Tuple[int, str]:
+    """Downloads a tar archive and extracts its members into `extract_dir` as they arrive, without
+    writing the archive to disk.  Returns `(archive size, sha256 hex digest)`."""
+    os.makedirs(extract_dir, exist_ok=True)
+    async with session.get(url, timeout=transfer.timeout()) as response:
+        response.raise_for_status()
+        reader = _ResponseStreamReader(response, asyncio.get_running_loop(), progress, transfer)
+        await asyncio.to_thread(_extract_tar_stream, reader, extract_dir, include, exclude)
+    return reader.size, reader.checksum.hexdigest()
+
+
+def _extract_archive(
+    archive_path: str,
+    extract_dir: str,
+    delete_archive: bool,
+    include: "re.Pattern" = None,
+    exclude: "re.Pattern" = None,
+):
+    """Extracts a downloaded bundle, optionally only the selected members; runs in an extraction
+    worker process or thread."""
+    os.makedirs(extract_dir, exist_ok=True)
+    with tarfile.open(archive_path, "r:*") as tar:
+        if include is None and exclude is None:
+            tar.extractall(path=extract_dir)
+        else:
+            tar.extractall(path=extract_dir,
+                           members=[member for member in tar if _member_selected(member.name, include, exclude)])
+    if delete_archive:
+        os.remove(archive_path)
+
+
+def _make_extraction_executor(kind: str, workers: int) -> Executor:
+    if kind == "process":
+        # The job already runs worker threads, and forking a multi-threaded process can deadlock the child.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="landsat-extract")
+    raise ValueError(f"Invalid extraction_executor {kind!r}; use 'process' or 'thread'.")
+
+
 def download_landsat_tool(
     output_directory: str,
     start_date: str,
@@ -42,14 +1982,41 @@ def download_landsat_tool(
     bounding_box: str = None,
     delete_archive: bool = True,
     max_concurrent_downloads: int = 5,
+    adaptive_concurrency: bool = False,
+    min_concurrent_downloads: int = 1,
+    download_order: str = "fifo",
+    download_segments: int = 1,
+    min_segment_size: int = 16 * 1024 * 1024,
+    stream_extract: bool = False,
+    extraction_workers: int = 2,
+    extraction_executor: str = "thread",
+    extract_include: List[str] = None,
+    extract_exclude: List[str] = None,
+    poll_initial_interval: float = 5.0,
+    poll_max_interval: float = 60.0,
+    poll_deadline: float = 3600.0,
+    download_retry_policy: Optional[RetryPolicy] = None,
+    transfer_config: Optional[TransferConfig] = None,
+    aoi_geojson: Union[dict, str] = None,
+    aoi_simplify_tolerance: float = 0.001,
+    wrs2_index: WRS2Index = None,
+    max_scenes: int = None,
+    search_window: Union[str, int] = None,
+    scene_catalog: SceneCatalog = None,
+    skip_existing: bool = True,
+    use_search_cache: bool = True,
+    search_cache: SceneSearchCache = None,
+    api_key_manager: ApiKeyManager = None,
+    run_stats: Optional[dict] = None,
+    client: M2MClient = None,
 ) -> str:
     """Downloads Landsat Collection 2 Level-2 imagery (Surface Reflectance/Temperature) asynchronously via the USGS M2M API.
 
     This function automates the process of searching for, requesting, and downloading Landsat data.
     It handles authentication, scene searching, download option retrieval, batch download requests,
     polling for download URLs, downloading files, and (optionally) extracting tar archives.  It uses
-    `asyncio` and `aiohttp` for concurrent downloads, significantly improving download speed.  `nest_asyncio`
-    is used to allow for nested event loops, making it suitable for use in Jupyter notebooks and IPython.
+    `asyncio` and `aiohttp` for concurrent downloads, significantly improving download speed.  Inside an
+    already running event loop (e.g. Jupyter notebooks), await `download_landsat_async` instead.
 
     Args:
         output_directory: The directory where downloaded files and extracted data will be stored.
@@ -58,48 +2025,286 @@ def download_landsat_tool(
         end_date: The end date for the imagery search (inclusive), in 'YYYY-MM-DD' format.
         max_cloud_cover: The maximum acceptable cloud cover percentage (0-100).  Defaults to 20.0.
         landsat_sensors: A list of Landsat sensor identifiers to search for.  Valid options are
-            "L8", "L9", "L7", and "L5". Defaults to ["L8", "L9"] if not specified.
+            "L8", "L9", "L7", and "L5" (the TM dataset, which also includes Landsat 4 scenes).
+            Defaults to ["L8", "L9"] if not specified.
         bands: A list of band identifiers to download.  If None, the entire product bundle is
             downloaded.  Band identifiers should be in the format "B1", "B2", etc. (e.g., ["B2", "B3", "B4"]).
             If specified, individual band files are downloaded instead of the full bundle.
-        aoi_feature_class:  Not currently supported.  Reserved for future use with feature classes.
+        aoi_feature_class: Path to an AOI file.  GeoJSON files are read directly; shapefiles and other
+            vector formats require the optional `geopandas` package.  Every polygon is searched.
         bounding_box: A string defining the bounding box for the search, in the format
-            "min_lon,min_lat,max_lon,max_lat" (WGS84 coordinates).
+            "min_lon,min_lat,max_lon,max_lat" (WGS84 coordinates).  A box with min_lon > max_lon is
+            treated as crossing the antimeridian and searched as two boxes.
         delete_archive: If True (default), downloaded tar archives are deleted after extraction
             (only applicable when downloading full bundles, i.e., when `bands` is None).
         max_concurrent_downloads: The maximum number of concurrent downloads. Defaults to 5.  Higher
             values can improve download speed but may overwhelm your system or the server.
+        adaptive_concurrency: If True, the number of concurrent downloads is tuned during the run (AIMD):
+            it grows by one while aggregate throughput keeps improving and is halved after transient
+            errors or throttling, staying between `min_concurrent_downloads` (default 1) and
+            `max_concurrent_downloads`.
+        min_concurrent_downloads: Lower bound for adaptive concurrency.
+        download_order: Scheduling policy for files whose URLs are available: "fifo" (default),
+            "largest_first" (shortens the tail of a job by not leaving big bundles for last),
+            "acquisition_date" (oldest first) or "by_scene" (complete one scene before the next).
+        download_segments: Number of concurrent byte-range segments used to fetch each file.  Defaults to 1
+            (a single stream).  Larger values raise per-file throughput on high-latency links; servers
+            without range support fall back to a single stream.  Applies on top of `max_concurrent_downloads`.
+        min_segment_size: Minimum size in bytes of a segment (default 16 MiB), so small files are not split.
+        stream_extract: If True, full bundles are extracted while they download, straight from the HTTP
+            stream, and the `.tar.gz` is never written to disk (halving disk I/O).  Such transfers
+            cannot be resumed or segmented.  Only applies when `bands` is None.
+        extraction_workers: Number of bundles extracted in parallel (default 2).  Extraction runs in its own
+            pool, fed through a bounded queue, so downloads keep going while archives are unpacked.
+        extraction_executor: "thread" (default) to extract in a thread pool, or "process" for a process
+            pool using spare cores.  Worker processes are started with forkserver/spawn, which
+            re-import the calling script, so "process" requires the call to sit under an
+            `if __name__ == "__main__":` guard.
+        extract_include: Optional glob patterns (e.g. ["*_SR_B*.TIF", "*_QA_PIXEL.TIF", "*_MTL.txt"]); when
+            given, only bundle members matching one of them are extracted.
+        extract_exclude: Optional glob patterns of bundle members never to extract (e.g. ["*_ST_*"]).
+        poll_initial_interval: Seconds before the first `download-retrieve` poll for files still being
+            prepared (default 5).  The interval grows by 1.5x while nothing new is ready, up to
+            `poll_max_interval` (default 60), and drops back whenever new URLs arrive.  Downloads
+            start as soon as each URL is available.
+        poll_deadline: Overall seconds to keep polling for files still being prepared (default 3600).
+            Polling ends as soon as no file is left requested or preparing; files rejected by the
+            download request are not waited for.
+        download_retry_policy: Attempt budget and backoff for each file.  Network errors and
+            retryable statuses are retried, expired signed URLs (401/403/410) are refreshed through
+            download-retrieve, and other 4xx responses fail the file at once.  Defaults to 4 attempts.
+        transfer_config: A `TransferConfig` with the connection pool limits (total and per host),
+            DNS cache TTL, keep-alive and the connect / socket-read / stall timeouts of file transfers.
+            There is no total timeout, so slow but steadily progressing downloads are not aborted.
+            By default the limits are raised to `max_concurrent_downloads * download_segments`; a
+            config whose limits are lower than that is rejected with an error.
+        aoi_geojson: A GeoJSON Polygon, MultiPolygon, Feature or FeatureCollection (dict or JSON string)
+            to search instead of, or in addition to, `bounding_box` / `aoi_feature_class`.
+        aoi_simplify_tolerance: Douglas-Peucker tolerance in degrees applied to AOI polygons before they
+            are sent, keeping search payloads small.  Defaults to 0.001 (~100 m); 0 disables it.
+        wrs2_index: An optional `WRS2Index`.  When given, the AOI is resolved to WRS-2 path/rows locally
+            and one search per path/row is run with path/row metadata filters instead of a geojson
+            spatial filter (falling back to the spatial filter if the dataset lacks those fields).
+        max_scenes: Optional cap on the number of scenes taken from each dataset search.  All result
+            pages are fetched (concurrently) when None.
+        search_window: Optional temporal sharding of the acquisition range: "month", "year" or a
+            number of days.  Each window is searched concurrently and results are merged by entityId,
+            keeping individual responses small for multi-year ranges.  None (default) runs one search.
+        scene_catalog: An optional `SceneCatalog`.  When given, searches run in incremental sync mode:
+            only acquisition dates the catalog has not synced yet for this AOI (plus a short resync
+            tail) are requested from the M2M API, and the result is answered from the local catalog.
+        skip_existing: If True (default), files recorded as complete in the output directory's
+            download manifest are left out of the download request, so reruns only fetch what is missing.
+        use_search_cache: If True (default), `scene-search` responses are served from and stored in a
+            persistent `SceneSearchCache`.  Set to False to always query the M2M API.
+        search_cache: An optional `SceneSearchCache` instance to use instead of the default cache file
+            under `~/.cache/landsat_m2m`.
+        api_key_manager: An optional `ApiKeyManager` holding the M2M API key.  Defaults to a
+            process-wide manager, so the key is reused across calls and logged out at exit.
+        run_stats: An optional dict that is filled with statistics of the download stage: file counts
+            per state, bytes downloaded, throughput, transient errors, and `concurrency_history`, a
+            list of `(seconds since start, concurrent downloads)` changes.
+        client: An optional `M2MClient` to use for M2M API calls.  Pass a shared instance to reuse
+            pooled keep-alive connections across calls; if None, a client is created for this call
+            and closed before returning.
 
     Returns:
         A string summarizing the result of the download process, indicating the number of
         files/scenes downloaded and the output directory.  Returns an error message if any
         part of the process fails."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        return "Error: download_landsat_tool cannot run inside a running event loop; await download_landsat_async(...) instead."
 
-    base_url = "https://m2m.cr.usgs.gov/api/api/json/stable/"
+    owns_client = client is None
+    if owns_client:
+        client = M2MClient()
+    try:
+        return asyncio.run(_run_landsat_job(client, output_directory=output_directory, start_date=start_date,
+                                            end_date=end_date, max_cloud_cover=max_cloud_cover,
+                                            landsat_sensors=landsat_sensors, bands=bands,
+                                            aoi_feature_class=aoi_feature_class, bounding_box=bounding_box,
+                                            delete_archive=delete_archive,
+                                            max_concurrent_downloads=max_concurrent_downloads,
+                                            adaptive_concurrency=adaptive_concurrency,
+                                            min_concurrent_downloads=min_concurrent_downloads,
+                                            download_order=download_order, download_segments=download_segments,
+                                            min_segment_size=min_segment_size, stream_extract=stream_extract,
+                                            extraction_workers=extraction_workers,
+                                            extraction_executor=extraction_executor,
+                                            extract_include=extract_include, extract_exclude=extract_exclude,
+                                            poll_initial_interval=poll_initial_interval,
+                                            poll_max_interval=poll_max_interval, poll_deadline=poll_deadline,
+                                            download_retry_policy=download_retry_policy,
+                                            transfer_config=transfer_config, aoi_geojson=aoi_geojson,
+                                            aoi_simplify_tolerance=aoi_simplify_tolerance,
+                                            wrs2_index=wrs2_index, max_scenes=max_scenes,
+                                            search_window=search_window, scene_catalog=scene_catalog,
+                                            skip_existing=skip_existing, use_search_cache=use_search_cache,
+                                            search_cache=search_cache, api_key_manager=api_key_manager,
+                                            run_stats=run_stats))
+    finally:
+        if owns_client:
+            client.close()
 
-    def m2m_request(endpoint: str, payload: dict, apiKey: str = None) -> dict:
-        url = base_url + endpoint
-        headers = {}
-        if apiKey:
-            headers["X-Auth-Token"] = apiKey
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        response.raise_for_status()
-        resp_json = response.json()
-        if resp_json.get("errorCode"):
-            raise Exception(f"{resp_json.get('errorCode', 'Unknown Error')}: {resp_json.get('errorMessage', '')}")
-        return resp_json.get("data")
+
+async def download_landsat_async(
+    output_directory: str,
+    start_date: str,
+    end_date: str,
+    max_cloud_cover: float = 20.0,
+    landsat_sensors: List[str] = None,
+    bands: List[str] = None,
+    aoi_feature_class: str = None,
+    bounding_box: str = None,
+    delete_archive: bool = True,
+    max_concurrent_downloads: int = 5,
+    adaptive_concurrency: bool = False,
+    min_concurrent_downloads: int = 1,
+    download_order: str = "fifo",
+    download_segments: int = 1,
+    min_segment_size: int = 16 * 1024 * 1024,
+    stream_extract: bool = False,
+    extraction_workers: int = 2,
+    extraction_executor: str = "thread",
+    extract_include: List[str] = None,
+    extract_exclude: List[str] = None,
+    poll_initial_interval: float = 5.0,
+    poll_max_interval: float = 60.0,
+    poll_deadline: float = 3600.0,
+    download_retry_policy: Optional[RetryPolicy] = None,
+    transfer_config: Optional[TransferConfig] = None,
+    aoi_geojson: Union[dict, str] = None,
+    aoi_simplify_tolerance: float = 0.001,
+    wrs2_index: WRS2Index = None,
+    max_scenes: int = None,
+    search_window: Union[str, int] = None,
+    scene_catalog: SceneCatalog = None,
+    skip_existing: bool = True,
+    use_search_cache: bool = True,
+    search_cache: SceneSearchCache = None,
+    api_key_manager: ApiKeyManager = None,
+    run_stats: Optional[dict] = None,
+    client: AsyncM2MClient = None,
+) -> str:
+    """Coroutine version of `download_landsat_tool`.
+
+    Every phase (scene search, download options, download request, polling and downloading) runs
+    as a coroutine on the caller's event loop, so several AOI jobs can be awaited concurrently with
+    `asyncio.gather` and share one `AsyncM2MClient`.  Arguments and return value are the same as
+    `download_landsat_tool`, except that `client` must be an `AsyncM2MClient`.
+    """
+    owns_client = client is None
+    if owns_client:
+        client = AsyncM2MClient()
+    try:
+        return await _run_landsat_job(client, output_directory=output_directory, start_date=start_date,
+                                      end_date=end_date, max_cloud_cover=max_cloud_cover,
+                                      landsat_sensors=landsat_sensors, bands=bands,
+                                      aoi_feature_class=aoi_feature_class, bounding_box=bounding_box,
+                                      delete_archive=delete_archive,
+                                      max_concurrent_downloads=max_concurrent_downloads,
+                                      adaptive_concurrency=adaptive_concurrency,
+                                      min_concurrent_downloads=min_concurrent_downloads,
+                                      download_order=download_order, download_segments=download_segments,
+                                      min_segment_size=min_segment_size, stream_extract=stream_extract,
+                                      extraction_workers=extraction_workers,
+                                      extraction_executor=extraction_executor, extract_include=extract_include,
+                                      extract_exclude=extract_exclude,
+                                      poll_initial_interval=poll_initial_interval,
+                                      poll_max_interval=poll_max_interval, poll_deadline=poll_deadline,
+                                      download_retry_policy=download_retry_policy,
+                                      transfer_config=transfer_config, aoi_geojson=aoi_geojson,
+                                      aoi_simplify_tolerance=aoi_simplify_tolerance, wrs2_index=wrs2_index,
+                                      max_scenes=max_scenes, search_window=search_window,
+                                      scene_catalog=scene_catalog, skip_existing=skip_existing,
+                                      use_search_cache=use_search_cache, search_cache=search_cache,
+                                      api_key_manager=api_key_manager, run_stats=run_stats)
+    finally:
+        if owns_client:
+            await client.close()
+
+
+async def _run_landsat_job(
+    client,
+    *,
+    output_directory: str,
+    start_date: str,
+    end_date: str,
+    max_cloud_cover: float,
+    landsat_sensors: List[str],
+    bands: List[str],
+    aoi_feature_class: str,
+    bounding_box: str,
+    delete_archive: bool,
+    max_concurrent_downloads: int,
+    adaptive_concurrency: bool,
+    min_concurrent_downloads: int,
+    download_order: str,
+    download_segments: int,
+    min_segment_size: int,
+    stream_extract: bool,
+    extraction_workers: int,
+    extraction_executor: str,
+    extract_include: Optional[List[str]],
+    extract_exclude: Optional[List[str]],
+    poll_initial_interval: float,
+    poll_max_interval: float,
+    poll_deadline: float,
+    download_retry_policy: Optional[RetryPolicy],
+    transfer_config: Optional[TransferConfig],
+    aoi_geojson: Union[dict, str, None],
+    aoi_simplify_tolerance: float,
+    wrs2_index: Optional[WRS2Index],
+    max_scenes: Optional[int],
+    search_window: Union[str, int, None],
+    scene_catalog: Optional[SceneCatalog],
+    skip_existing: bool,
+    use_search_cache: bool,
+    search_cache: Optional[SceneSearchCache],
+    api_key_manager: Optional[ApiKeyManager],
+    run_stats: Optional[dict],
+) -> str:
+
+    async def m2m_request(endpoint: str, payload: dict, apiKey: str = None) -> dict:
+        if isinstance(client, AsyncM2MClient):
+            return await client.request(endpoint, payload, apiKey)
+        # Sync client: run the blocking call in a worker thread so the loop keeps serving other jobs.
+        return await asyncio.to_thread(client.request, endpoint, payload, apiKey)
+
+    if api_key_manager is None:
+        api_key_manager = get_default_api_key_manager()
+
+    async def m2m_call(endpoint: str, payload: dict) -> dict:
+        """Authenticated request; logs in again once if the API reports the key as expired."""
+        apiKey = await api_key_manager.get_key(m2m_request)
+        try:
+            return await m2m_request(endpoint, payload, apiKey)
+        except M2MError as e:
+            if e.error_code not in AUTH_EXPIRED_ERROR_CODES:
+                raise
+            api_key_manager.invalidate(apiKey)
+            apiKey = await api_key_manager.get_key(m2m_request)
+            return await m2m_request(endpoint, payload, apiKey)
 
     # --- Input validation and setup ---
-    if not all([output_directory, start_date, end_date, bounding_box]):
-        return "Error: output_directory, start_date, end_date, and bounding_box are required."
+    if not all([output_directory, start_date, end_date]) or not (bounding_box or aoi_geojson or aoi_feature_class):
+        return ("Error: output_directory, start_date, end_date, and one of bounding_box, aoi_geojson "
+                "or aoi_feature_class are required.")
     os.makedirs(output_directory, exist_ok=True)
 
+    if bounding_box:
+        try:
+            _parse_bounding_box(bounding_box)
+        except (ValueError, TypeError):
+            return "Error: Invalid bounding_box format. Use 'min_lon,min_lat,max_lon,max_lat'."
     try:
-        min_lon, min_lat, max_lon, max_lat = map(float, bounding_box.split(","))
-        if not (-180 <= min_lon <= 180 and -90 <= min_lat <= 90 and -180 <= max_lon <= 180 and -90 <= max_lat <= 90):
-            raise ValueError()
-    except (ValueError, TypeError):
-        return "Error: Invalid bounding_box format. Use 'min_lon,min_lat,max_lon,max_lat'."
+        aoi_polygons = _resolve_aoi(bounding_box, aoi_geojson, aoi_feature_class, aoi_simplify_tolerance)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return f"Error: Invalid AOI: {str(e)}"
 
     try:
         datetime.strptime(start_date, "%Y-%m-%d")
@@ -111,10 +2316,8 @@ def download_landsat_tool(
         landsat_sensors = ["L8", "L9"]
 
 
-    login_payload = {"username": username, "token": token}
     try:
-        apiKey = m2m_request("login-token", login_payload)
-        print("Login successful.")
+        await api_key_manager.get_key(m2m_request)
     except Exception as e:
         return f"Login failed: {str(e)}"
 
@@ -125,44 +2328,144 @@ def download_landsat_tool(
         "L7": "landsat_etm_c2_l2",
         "L5": "landsat_tm_c2_l2"
     }
-    scene_list = []
+    # L8 and L9 share one dataset, so search each dataset once and split the results by spacecraft.
+    sensors_by_dataset: Dict[str, List[str]] = {}
     for sensor in landsat_sensors:
         sensor_key = sensor.upper()
         if sensor_key not in datasets_map:
-            m2m_request("logout", {}, apiKey)
             return f"Error: Invalid sensor '{sensor}'."
-        dataset = datasets_map[sensor_key]
-        search_payload = {
-            "datasetName": dataset,
-            "sceneFilter": {
-                "spatialFilter": {"filterType": "geojson", "geoJson": {
-                    "type": "Polygon",
-                    "coordinates": [[
-                        [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, min_lat], [min_lon, min_lat]
-                    ]]
-                }},
-                "acquisitionFilter": {"start": start_date, "end": end_date},
-                "cloudCoverFilter": {"min": 0, "max": int(max_cloud_cover)}
-            }
+        dataset_sensors = sensors_by_dataset.setdefault(datasets_map[sensor_key], [])
+        if sensor_key not in dataset_sensors:
+            dataset_sensors.append(sensor_key)
+
+    try:
+        _plan_acquisition_windows(start_date, end_date, search_window)
+    except ValueError as e:
+        return f"Error: {str(e)}"
+
+    if download_retry_policy is None:
+        download_retry_policy = RetryPolicy(max_attempts=4, backoff_base=2.0)
+    # Every download worker may hold download_segments connections to the same host at once.
+    connections_needed = max_concurrent_downloads * max(1, download_segments)
+    if transfer_config is None:
+        transfer_config = TransferConfig(limit=max(DEFAULT_TRANSFER_CONFIG.limit, connections_needed),
+                                         limit_per_host=max(DEFAULT_TRANSFER_CONFIG.limit_per_host, connections_needed))
+    elif any(0 < limit < connections_needed for limit in (transfer_config.limit, transfer_config.limit_per_host)):
+        return (f"Error: transfer_config allows {transfer_config.limit} connections ({transfer_config.limit_per_host} "
+                f"per host), but max_concurrent_downloads * download_segments needs {connections_needed}.")
+
+    if download_order not in DOWNLOAD_ORDERS:
+        return f"Error: download_order must be one of {', '.join(DOWNLOAD_ORDERS)}."
+
+    if extraction_executor not in ("process", "thread") or extraction_workers < 1:
+        return "Error: extraction_executor must be 'process' or 'thread' and extraction_workers at least 1."
+
+    wrs2_tiles: List[Tuple[int, int]] = []
+    if wrs2_index is not None:
+        wrs2_tiles = sorted({tile for polygon in aoi_polygons for tile in wrs2_index.path_rows(polygon)})
+        days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days + 1
+        # Each Landsat satellite revisits a path/row every 16 days.
+        print(f"AOI covers {len(wrs2_tiles)} WRS-2 path/rows "
+              f"(~{len(wrs2_tiles) * (days // 16 + 1)} acquisitions per sensor before cloud filtering).")
+
+    async def _location_filters(dataset: str) -> List[dict]:
+        if wrs2_tiles:
+            try:
+                filter_ids = await _wrs2_filter_ids(m2m_call, dataset)
+            except Exception as e:
+                print(f"Could not look up the WRS path/row filters of {dataset} ({str(e)}); using the spatial filter.")
+            else:
+                if filter_ids is not None:
+                    return [{"metadataFilter": _wrs2_metadata_filter(filter_ids, path, row)}
+                            for path, row in wrs2_tiles]
+                print(f"Dataset {dataset} has no WRS path/row filters; using the spatial filter.")
+        return [{"spatialFilter": {"filterType": "geojson", "geoJson": polygon}} for polygon in aoi_polygons]
+
+    async def _search_window(dataset: str, location_filter: dict, window_start: str, window_end: str):
+        scene_filter = {
+            **location_filter,
+            "acquisitionFilter": {"start": window_start, "end": window_end},
+            "cloudCoverFilter": {"min": 0, "max": int(max_cloud_cover)}
         }
+        cache_key = None
+        if search_cache is not None:
+            cache_key = SceneSearchCache.make_key(dataset, scene_filter, max_scenes)
+            cached = search_cache.get(cache_key)
+            if cached is not None:
+                return cached.get("results", [])
+        results = await _scene_search_all(m2m_call, dataset, scene_filter, max_scenes)
+        if cache_key is not None:
+            search_cache.put(cache_key, {"results": results})
+        return results
+
+    async def _search_range(dataset: str, location_filter: dict, range_start: str, range_end: str):
+        window_results = await asyncio.gather(*[_search_window(dataset, location_filter, window_start, window_end)
+                                                for window_start, window_end
+                                                in _plan_acquisition_windows(range_start, range_end, search_window)])
+        return _merge_scene_results(window_results)
+
+    async def _sync_range(dataset: str, location_filter: dict, aoi_key: str, range_start: str, range_end: str):
+        scenes = await _search_range(dataset, location_filter, range_start, range_end)
+        scene_catalog.add_scenes(aoi_key, dataset, scenes)
+        if max_scenes is None:  # A capped search may be incomplete, so it does not count as synced.
+            scene_catalog.mark_synced(aoi_key, range_start, range_end)
+
+    async def _search_location(dataset: str, location_filter: dict):
+        if scene_catalog is None:
+            return await _search_range(dataset, location_filter, start_date, end_date)
+        aoi_key = SceneCatalog.make_aoi_key(dataset, location_filter, int(max_cloud_cover))
+        missing = scene_catalog.missing_ranges(aoi_key, start_date, end_date)
+        await asyncio.gather(*[_sync_range(dataset, location_filter, aoi_key, range_start, range_end)
+                               for range_start, range_end in missing])
+        return scene_catalog.query(aoi_key, start_date, end_date)
+
+    async def _search_dataset(dataset: str):
+        location_filters = await _location_filters(dataset)
+        location_results = await asyncio.gather(*[_search_location(dataset, location_filter)
+                                                  for location_filter in location_filters])
+        results = _merge_scene_results(location_results)
+        return results if max_scenes is None else results[:max_scenes]
+
+    owns_search_cache = use_search_cache and search_cache is None
+    if owns_search_cache:
         try:
-            search_data = m2m_request("scene-search", search_payload, apiKey)
-            results = search_data.get("results", [])
+            search_cache = SceneSearchCache()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Scene-search cache unavailable, continuing without it: {str(e)}")
+            search_cache = None
+    elif not use_search_cache:
+        search_cache = None
+
+    # Searches for different datasets are independent, so run them concurrently.
+    try:
+        search_outcomes = await asyncio.gather(*[_search_dataset(ds) for ds in sensors_by_dataset],
+                                               return_exceptions=True)
+    finally:
+        if search_cache is not None:
+            print(f"Scene-search cache: {search_cache.hits} hits, {search_cache.misses} misses.")
+            if owns_search_cache:
+                search_cache.close()
+    scene_list = []
+    for (dataset, dataset_sensors), outcome in zip(sensors_by_dataset.items(), search_outcomes):
+        if isinstance(outcome, Exception):
+            return f"Search failed for sensor {', '.join(dataset_sensors)}: {str(outcome)}"
+        # Only the OLI/TIRS dataset is shared by several sensors; the TM dataset also holds Landsat 4
+        # scenes, which "L5" has always included, so other datasets are taken as they are.
+        shared_dataset = list(datasets_map.values()).count(dataset) > 1
+        for sensor_key in dataset_sensors:
+            results = [scene for scene in outcome if scene.get("entityId") and scene.get("displayId")
+                       and (not shared_dataset or _sensor_from_display_id(scene["displayId"]) == sensor_key)]
             print(f"Found {len(results)} scenes for sensor {sensor_key}.")
-            scene_list.extend([(scene.get("entityId"), dataset, scene.get("displayId"))
-                               for scene in results if scene.get("entityId") and scene.get("displayId")])
-        except Exception as e:
-            m2m_request("logout", {}, apiKey)
-            return f"Search failed for sensor {sensor_key}: {str(e)}"
+            scene_list.extend([(scene["entityId"], dataset, scene["displayId"]) for scene in results])
 
     if not scene_list:
-        m2m_request("logout", {}, apiKey)
         return "No scenes found."
 
     entity_to_display = {entityId: displayId for entityId, _, displayId in scene_list}
 
     # 4. Download Options
     downloads = []
+    scheduler = DownloadScheduler(download_order)
     dataset_groups: Dict[str, List[str]] = {}
     for entityId, ds, _ in scene_list:
         dataset_groups.setdefault(ds, []).append(entityId)
@@ -173,7 +2476,7 @@ def download_landsat_tool(
         for ds, entityIds in dataset_groups.items():
             payload = {"datasetName": ds, "entityIds": entityIds}
             try:
-                dload_data = m2m_request("download-options", payload, apiKey)
+                dload_data = await m2m_call("download-options", payload)
                 if isinstance(dload_data, list):
                     options = dload_data
                 elif isinstance(dload_data, dict):
@@ -190,6 +2493,7 @@ def download_landsat_tool(
                     if ent in options_by_entity:
                         opt = options_by_entity[ent]
                         downloads.append({"entityId": ent, "productId": opt.get("id")})
+                        scheduler.describe(ent, opt.get("filesize"), _scene_path_row_date(entity_to_display[ent])[2])
                 # Removed: No longer needed for verbose output: print(f"Retrieved bundle download options for dataset {ds}.")
             except Exception as e:
                 print(f"Download-options request failed for dataset {ds}: {str(e)}")  # Keep: Important for error handling
@@ -198,7 +2502,7 @@ def download_landsat_tool(
         for dataset_name, entity_ids in dataset_groups.items():
             payload = {"datasetName": dataset_name, "entityIds": entity_ids}
             try:
-                options = m2m_request("download-options", payload, apiKey)
+                options = await m2m_call("download-options", payload)
                 if isinstance(options, dict):
                     options = options.get("options", [])
                 options_by_entity = {opt["entityId"]: opt for opt in options if opt.get("available") and opt.get("entityId")}
@@ -211,116 +2515,262 @@ def download_landsat_tool(
                                 file_id = secondary_option.get("displayId", "")
                                 if any(file_id.endswith(f"_{band_code.upper()}.TIF") for band_code in bands):
                                     downloads.append({"entityId": secondary_option["entityId"], "productId": secondary_option["id"]})
+                                    scheduler.describe(secondary_option["entityId"], secondary_option.get("filesize"),
+                                                       _scene_path_row_date(entity_to_display[entity_id])[2], entity_id)
             except Exception as e:
                 print(f"Download-options request failed for dataset {dataset_name}: {str(e)}")
 
     if not downloads:
-        m2m_request("logout", {}, apiKey)
         return "No available downloads found."
 
+    manifest = DownloadManifest(output_directory) if skip_existing else None
+    if manifest is not None:
+        pending_downloads = manifest.pending(downloads)
+        if len(pending_downloads) < len(downloads):
+            print(f"Skipping {len(downloads) - len(pending_downloads)} files already downloaded.")
+        if not pending_downloads:
+            return f"All {len(downloads)} files are already downloaded in {output_directory}."
+        downloads = pending_downloads
+
     # 5. Download Request
     label = datetime.now().strftime("%Y%m%d_%H%M%S")
     req_payload = {"downloads": downloads, "label": label}
     try:
-        req_results = m2m_request("download-request", req_payload, apiKey)
+        req_results = await m2m_call("download-request", req_payload)
         print("Download request submitted.")
         available_downloads = req_results.get("availableDownloads", [])
         preparing_downloads = req_results.get("preparingDownloads", [])
+        rejected_downloads = list(req_results.get("failed") or []) + list(req_results.get("duplicateProducts") or [])
     except Exception as e:
-        m2m_request("logout", {}, apiKey)
         return f"Download request failed: {str(e)}"
 
-    # 6. Poll for Download URLs (if needed) - CORRECTED LOGIC
-    if preparing_downloads:  # Poll if *anything* is preparing
+    # 6. Poll for Download URLs: newly available URLs are queued for download as soon as they appear.
+    registry = DownloadRegistry(downloads)
+    registry.mark_preparing(preparing_downloads)
+    if rejected_downloads:
+        print(f"{len(rejected_downloads)} files were rejected by the download request and will be skipped.")
+        registry.mark_failed(rejected_downloads)
+
+    def _queue_available(items: List[dict]) -> int:
+        # download-retrieve returns every URL available for the label so far; the registry drops repeats.
+        # Never waits for the workers, so time spent downloading is not charged to poll_deadline.
+        new_items = scheduler.sort([item for item in items if registry.offer(item)])
+        for item in new_items:
+            scheduler.put_nowait(item)
+        return len(new_items)
+
+    async def _poll_until_available():
+        _queue_available(available_downloads)
         retrieve_payload = {"label": label}
-        max_attempts = 10
-        for attempt in range(max_attempts):
+        interval = poll_initial_interval
+        deadline = time.monotonic() + poll_deadline
+        attempt = 0
+        while registry.waiting():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"{registry.waiting()} files were still being prepared after "
+                      f"{poll_deadline:.0f}s; rerun later to download them.")
+                return
+            await asyncio.sleep(min(interval, remaining))
+            attempt += 1
             try:
-                ret_data = m2m_request("download-retrieve", retrieve_payload, apiKey)
-                if ret_data and ret_data.get("available"):
-                    available_downloads.extend(ret_data["available"])  # Add new URLs
-                    print(f"Attempt {attempt + 1}: Retrieved {len(ret_data['available'])} URLs.")
-                    if len(available_downloads) >= len(downloads):
-                        break  # Exit loop when we have all URLs
-                else:
-                    print("No download URLs retrieved yet.")
+                ret_data = await m2m_call("download-retrieve", retrieve_payload)
+                added = _queue_available((ret_data or {}).get("available") or [])
             except Exception as e:
-                print(f"Download-retrieve attempt {attempt + 1} failed: {str(e)}")
-            if attempt < max_attempts - 1:
-                print(f"Waiting 20 seconds... ({attempt + 1}/{max_attempts})")
-                time.sleep(20)
+                print(f"Download-retrieve attempt {attempt} failed: {str(e)}")
+                added = 0
+            if added:
+                print(f"Attempt {attempt}: Retrieved {added} new URLs ({registry.waiting()} still preparing).")
+                interval = poll_initial_interval  # More files are likely to become ready soon.
+            else:
+                interval = min(poll_max_interval, interval * 1.5)
 
+    async def _poll_download_urls():
+        try:
+            await _poll_until_available()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Polling for download URLs stopped: {str(e)}")
+        await scheduler.put(None)  # Tells the download workers that no more URLs will come.
 
-    # 7. Download and Process (ASYNC)
-    async def _download_and_process(downloads_to_process):
-        async def _download_single_file(session, item, semaphore):
-            async with semaphore:
-                download_url = item.get("url")
-                if not download_url:
-                    return None
+    # 7. Download and Process
+    include_pattern = _compile_member_patterns(extract_include)
+    exclude_pattern = _compile_member_patterns(extract_exclude)
 
-                try:
-                    async with session.get(download_url, timeout=300) as response:
-                        response.raise_for_status()
-
-                        if bands is not None:
-                            new_fname = item.get("fileName")
-                            if not new_fname:
-                                entity_id = item.get("entityId")
-                                if entity_id:
-                                    new_fname = entity_id + ".TIF"
-                                else:
-                                    print(f"Warning: entityId missing, skipping: {item}")
-                                    return None
-                        else:
-                            entity = item.get("entityId")
-                            display_id = entity_to_display.get(entity)
-                            new_fname = (display_id + ".tar.gz") if display_id else os.path.basename(urlparse(download_url).path)
-
-                        final_path = os.path.join(output_directory, new_fname)
-                        async with aiofiles.open(final_path, 'wb') as f:
-                            async for chunk in response.content.iter_chunked(8192):
-                                await f.write(chunk)
-                        print(f"Downloaded: {new_fname}")
-
-                        if bands is None and new_fname.endswith(".tar.gz"):
-                            try:
-                                with tarfile.open(final_path, "r:*") as tar:
-                                    extract_dir = os.path.join(output_directory, entity_to_display.get(item.get("entityId"), ""))
-                                    os.makedirs(extract_dir, exist_ok=True)
-                                    tar.extractall(path=extract_dir)
-                                print(f"Extracted: {new_fname}")
-                                if delete_archive:
-                                    os.remove(final_path)
-                                    print(f"Deleted archive: {final_path}")
-                            except Exception as e:
-                                print(f"Error extracting {final_path}: {str(e)}")
-                        return final_path
+    if adaptive_concurrency:
+        limiter = AdaptiveConcurrencyLimiter(max(min_concurrent_downloads, max_concurrent_downloads // 2),
+                                             minimum=min_concurrent_downloads, maximum=max_concurrent_downloads)
+    else:
+        limiter = AdaptiveConcurrencyLimiter(max_concurrent_downloads)
+    refresh_lock = asyncio.Lock()
 
-                except Exception as e:
-                    print(f"Download failed for {download_url}: {str(e)}")
-                    return None
+    async def _download_and_process(pending_urls: DownloadScheduler):
+        async def _download_single_file(session, item):
+            """Downloads one file; raises on failure so that `_download_with_retries` can decide what to do."""
+            download_url = item["url"]
+            registry.set_state(item, DownloadRegistry.DOWNLOADING)
+            if bands is not None:
+                new_fname = item.get("fileName")
+                if not new_fname:
+                    entity_id = item.get("entityId")
+                    if entity_id:
+                        new_fname = entity_id + ".TIF"
+                    else:
+                        print(f"Warning: entityId missing, skipping: {item}")
+                        registry.set_state(item, DownloadRegistry.FAILED)
+                        return None
+            else:
+                entity = item.get("entityId")
+                display_id = entity_to_display.get(entity)
+                new_fname = (display_id + ".tar.gz") if display_id else os.path.basename(urlparse(download_url).path)
 
-        semaphore = asyncio.Semaphore(max_concurrent_downloads)
-        async with aiohttp.ClientSession() as session:
-            tasks = [_download_single_file(session, item, semaphore) for item in downloads_to_process]
-            return await asyncio.gather(*tasks)
+            final_path = os.path.join(output_directory, new_fname)
+            if bands is None and stream_extract and new_fname.endswith(".tar.gz"):
+                extract_dir = os.path.join(output_directory, new_fname[:-len(".tar.gz")])
+                size, checksum = await _stream_extract(session, download_url, extract_dir, include_pattern,
+                                                       exclude_pattern, limiter.record_bytes, transfer_config)
+                print(f"Downloaded and extracted: {new_fname}")
+                if manifest is not None and item.get("entityId"):
+                    manifest.record(item["entityId"], item.get("productId"), extract_dir, None, checksum)
+                registry.set_state(item, DownloadRegistry.DONE)
+                return extract_dir
 
-    downloaded_files: List[str] = []
-    try:
-        # ALWAYS process available_downloads
-        downloaded_files = asyncio.run(_download_and_process(available_downloads))
-        downloaded_files = [path for path in downloaded_files if path is not None]  # Filter out failures
+            # One attempt per call: `_download_with_retries` owns the budget, and the .part file lets
+            # its next attempt resume where this one stopped.
+            if download_segments > 1:
+                size, checksum = await _fetch_segmented(session, download_url, final_path, download_segments,
+                                                        min_segment_size, progress=limiter.record_bytes,
+                                                        transfer=transfer_config)
+            else:
+                size, checksum = await _fetch_to_file(session, download_url, final_path, attempts=1,
+                                                      progress=limiter.record_bytes, transfer=transfer_config)
+            print(f"Downloaded: {new_fname}")
+
+            if bands is None and new_fname.endswith(".tar.gz"):
+                # Hand the archive to the extraction stage and free this download slot.
+                await extraction_queue.put((item, final_path, size, checksum))
+                return final_path
+            if manifest is not None and item.get("entityId"):
+                manifest.record(item["entityId"], item.get("productId"), final_path, size, checksum)
+            registry.set_state(item, DownloadRegistry.DONE)
+            return final_path
+
+        async def _refresh_download_url(item: dict) -> Optional[dict]:
+            # Concurrent failures of the same batch share one download-retrieve call via the lock.
+            key, stale_url = registry.key(item), item.get("url")
+            async with refresh_lock:
+                current = registry.items.get(key)
+                if current is None or current.get("url") == stale_url:
+                    try:
+                        ret_data = await m2m_call("download-retrieve", {"label": label})
+                    except Exception as e:
+                        print(f"Could not refresh the download URL for {key}: {str(e)}")
+                        return None
+                    for fresh in (ret_data or {}).get("available") or []:
+                        registry.refresh(fresh)
+                    current = registry.items.get(key)
+            if current is None or current.get("url") == stale_url:
+                return None
+            return current
+
+        async def _download_with_retries(session, item):
+            max_attempts = download_retry_policy.max_attempts
+            for attempt in range(1, max_attempts + 1):
+                async with limiter:
+                    try:
+                        return await _download_single_file(session, item)
+                    except Exception as e:
+                        error = e
+                expired = isinstance(error, aiohttp.ClientResponseError) and error.status in EXPIRED_URL_HTTP_STATUSES
+                retryable = download_retry_policy.is_retryable(error)
+                if retryable:
+                    limiter.record_error()
+                if attempt == max_attempts or not (expired or retryable):
+                    break
+                delay = download_retry_policy.delay(attempt)
+                print(f"Download of {item.get('url')} failed ({str(error)}); retry {attempt}/{max_attempts - 1} "
+                      f"in {delay:.1f}s.")
+                # Sleep outside the limiter so that other files use the slot meanwhile.
+                await asyncio.sleep(delay)
+                if expired:
+                    refreshed = await _refresh_download_url(item)
+                    if refreshed is None:
+                        break
+                    item = refreshed
+            print(f"Download failed for {item.get('url')}: {str(error)}")
+            registry.set_state(item, DownloadRegistry.FAILED)
+            return None
+
+        async def _extraction_worker(executor: Executor):
+            loop = asyncio.get_running_loop()
+            while True:
+                item, final_path, size, checksum = await extraction_queue.get()
+                try:
+                    extract_dir = os.path.join(output_directory, entity_to_display.get(item.get("entityId"), ""))
+                    await loop.run_in_executor(executor, _extract_archive, final_path, extract_dir, delete_archive,
+                                               include_pattern, exclude_pattern)
+                    print(f"Extracted: {os.path.basename(final_path)}")
+                    if delete_archive:
+                        print(f"Deleted archive: {final_path}")
+                    if manifest is not None and item.get("entityId"):
+                        completed_path = extract_dir if delete_archive else final_path
+                        manifest.record(item["entityId"], item.get("productId"), completed_path,
+                                        None if delete_archive else size, checksum)
+                    registry.set_state(item, DownloadRegistry.DONE)
+                except Exception as e:
+                    # Not recorded in the manifest, so the next run fetches it again.
+                    print(f"Error extracting {final_path}: {str(e)}")
+                    registry.set_state(item, DownloadRegistry.FAILED)
+                finally:
+                    extraction_queue.task_done()
+
+        async def _download_worker(session):
+            while (item := await pending_urls.get()) is not None:
+                if await _download_with_retries(session, item) is None:
+                    progress["failed"] += 1
+                else:
+                    progress["downloaded"] += 1
+                finished = progress["downloaded"] + progress["failed"]
+                if finished % 100 == 0:
+                    print(f"Progress: {finished} files finished ({progress['failed']} failed), "
+                          f"{registry.waiting()} still being prepared.")
+            pending_urls.put_nowait(None)  # Let the other workers see the end of the stream too.
 
-    except RuntimeError as e:
-        print(f"RuntimeError: {e}")
+        # Bounded so that downloads pause, rather than fill the disk, when extraction falls behind.
+        extraction_queue: asyncio.Queue = asyncio.Queue(maxsize=2 * extraction_workers)
+        progress = {"downloaded": 0, "failed": 0}
+        executor = _make_extraction_executor(extraction_executor, extraction_workers)
+        extractors = [asyncio.create_task(_extraction_worker(executor)) for _ in range(extraction_workers)]
+        try:
+            async with transfer_config.session() as session:
+                # One long-lived worker per possible slot; the limiter decides how many transfer at once.
+                downloaders = [asyncio.create_task(_download_worker(session)) for _ in range(limiter.maximum)]
+                try:
+                    await asyncio.gather(*downloaders)
+                finally:
+                    for downloader in downloaders:
+                        downloader.cancel()
+            await extraction_queue.join()
+        finally:
+            for extractor in extractors:
+                extractor.cancel()
+            # Shutting down waits for a running extraction; do it off the loop so other jobs keep going.
+            await asyncio.get_running_loop().run_in_executor(None, partial(executor.shutdown, cancel_futures=True))
+        # Bundles only count once extracted, so take the total from the registry rather than `progress`.
+        return registry.count(DownloadRegistry.DONE)
 
-    # 8. Logout
+    poller = asyncio.create_task(_poll_download_urls())
     try:
-        m2m_request("logout", {}, apiKey)
-        print("Logged out.")
-    except Exception as e:
-        print(f"Logout failed: {str(e)}")
+        downloaded_count = await _download_and_process(scheduler)
+    finally:
+        poller.cancel()
+    print("Download states: " + ", ".join(f"{state}={n}" for state, n in sorted(registry.summary().items())))
+    if limiter.adaptive:
+        print("Download concurrency over time: " + ", ".join(f"{t:.0f}s={n}" for t, n in limiter.history))
+    if run_stats is not None:
+        run_stats.update(limiter.stats())
+        run_stats["download_states"] = registry.summary()
 
-    return f"Successfully downloaded {len(downloaded_files)} files to {output_directory}."
+    return f"Successfully downloaded {downloaded_count} files to {output_directory}."
 
@@ -1,5 +1,49 @@
+import asyncio
+import json
+import hashlib
+import inspect
+import io
+import os
+import tarfile
 import pytest
-from src.landsat_m2m_api import download_landsat_tool
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from src.landsat_m2m_api import (
+    download_landsat_tool,
+    download_landsat_async,
+    _run_landsat_job,
+    M2MClient,
+    SceneSearchCache,
+    ApiKeyManager,
+    M2MError,
+    RetryPolicy,
+    RateLimiter,
+    _scene_search_all,
+    _sensor_from_display_id,
+    _plan_acquisition_windows,
+    _merge_scene_results,
+    _parse_bounding_box,
+    _resolve_aoi,
+    _segments_cross,
+    _rings_intersect,
+    WRS2Index,
+    SceneCatalog,
+    DownloadManifest,
+    DownloadRegistry,
+    DownloadScheduler,
+    AdaptiveConcurrencyLimiter,
+    TransferConfig,
+    TransferStalledError,
+    _fetch_to_file,
+    _fetch_segmented,
+    _stream_extract,
+    _extract_archive,
+    _make_extraction_executor,
+    _compile_member_patterns,
+)
 
 
 # Example usage:
@@ -17,4 +61,870 @@ max_concurrent_downloads = 5
 result = download_landsat_tool(output_directory="test_output", start_date="2022-01-01", end_date="2022-01-31", 
                                bounding_box="-120.0,35.0,-119.0,36.0", max_cloud_cover=20.0, 
                                landsat_sensors=["L8", "L9"], bands=["B2", "B3", "B4"], 
-                               delete_archive=True, max_concurrent_downloads=5)
\ No newline at end of file
+                               delete_archive=True, max_concurrent_downloads=5)
+
+
+def test_m2m_client_endpoint_timeouts():
+    with M2MClient(timeouts={"scene-search": (5, 60)}) as client:
+        assert client.timeout_for("scene-search") == (5, 60)
+        assert client.timeout_for("unknown-endpoint") == client.timeouts["default"]
+
+
+def test_download_landsat_tool_refuses_running_loop():
+    async def _call_sync_tool():
+        return download_landsat_tool(output_directory="test_output", start_date="2022-01-01",
+                                     end_date="2022-01-31", bounding_box="-120.0,35.0,-119.0,36.0")
+
+    assert "download_landsat_async" in asyncio.run(_call_sync_tool())
+
+
+def test_download_landsat_async_validates_input():
+    result = asyncio.run(download_landsat_async(output_directory="test_output", start_date="2022-01-01",
+                                                end_date="2022-01-31", bounding_box="bad"))
+    assert result.startswith("Error: Invalid bounding_box")
+
+
+def test_public_entry_points_forward_every_job_option():
+    job_options = set(inspect.signature(_run_landsat_job).parameters)
+    for entry_point in (download_landsat_tool, download_landsat_async):
+        assert set(inspect.signature(entry_point).parameters) == job_options
+
+
+def test_scene_search_cache_hit_miss_and_eviction(tmp_path):
+    cache = SceneSearchCache(path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    key = SceneSearchCache.make_key("landsat_ot_c2_l2", {"cloudCoverFilter": {"min": 0, "max": 20},
+                                                         "acquisitionFilter": {"start": "2022-01-01"}})
+    same_key = SceneSearchCache.make_key("landsat_ot_c2_l2", {"acquisitionFilter": {"start": "2022-01-01"},
+                                                              "cloudCoverFilter": {"max": 20, "min": 0}})
+    assert key == same_key
+    assert cache.get(key) is None
+    cache.put(key, {"results": [{"entityId": "E1"}]})
+    assert cache.get(key) == {"results": [{"entityId": "E1"}]}
+    cache.put("k2", {})
+    cache.put("k3", {})
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 2}
+    cache.close()
+
+
+def test_scene_search_cache_ttl(tmp_path):
+    cache = SceneSearchCache(path=str(tmp_path / "cache.sqlite"), ttl_seconds=-1)
+    cache.put("k", {"results": []})
+    assert cache.get("k") is None
+    cache.close()
+
+
+def test_api_key_manager_reuses_key_and_shares_file(tmp_path):
+    logins = []
+
+    async def fake_request(endpoint, payload, apiKey=None):
+        logins.append(endpoint)
+        return f"key-{len(logins)}"
+
+    key_file = str(tmp_path / "apikey.json")
+    manager = ApiKeyManager(username="user", token="tok", cache_file=key_file)
+    assert asyncio.run(manager.get_key(fake_request)) == "key-1"
+    assert asyncio.run(manager.get_key(fake_request)) == "key-1"
+    assert oct(os.stat(key_file).st_mode & 0o777) == "0o600"
+
+    other_process = ApiKeyManager(username="user", token="tok", cache_file=key_file)
+    assert asyncio.run(other_process.get_key(fake_request)) == "key-1"
+    assert logins == ["login-token"]
+
+    manager.invalidate("key-1")
+    assert asyncio.run(manager.get_key(fake_request)) == "key-2"
+    assert json.load(open(key_file))["apiKey"] == "key-2"
+    other_process.invalidate("key-1")
+    assert asyncio.run(other_process.get_key(fake_request)) == "key-2"
+    assert logins == ["login-token", "login-token"]
+
+
+def test_api_key_manager_logs_in_once_across_threads():
+    logins = []
+
+    async def slow_login(endpoint, payload, apiKey=None):
+        logins.append(endpoint)
+        await asyncio.sleep(0.05)
+        return "key"
+
+    manager = ApiKeyManager(username="user", token="tok")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        keys = list(pool.map(lambda _: asyncio.run(manager.get_key(slow_login)), range(8)))
+    assert keys == ["key"] * 8
+    assert logins == ["login-token"]
+
+
+def test_retry_policy_classification_and_backoff():
+    policy = RetryPolicy(max_attempts=3, backoff_base=0.5, backoff_cap=1.5, jitter=False)
+    assert policy.is_retryable(M2MError("RATE_LIMIT", "slow down"))
+    assert not policy.is_retryable(M2MError("AUTH_INVALID"))
+    assert not policy.is_retryable(ValueError("bad payload"))
+    assert [policy.delay(n) for n in (1, 2, 3)] == [0.5, 1.0, 1.5]
+
+
+def test_m2m_client_retries_transient_errors(monkeypatch):
+    client = M2MClient(retry_policy=RetryPolicy(max_attempts=3, backoff_base=0, jitter=False))
+    outcomes = [M2MError("TEMPORARILY_UNAVAILABLE"), M2MError("RATE_LIMIT"), "data"]
+
+    def fake_once(endpoint, payload, apiKey=None):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(client, "_request_once", fake_once)
+    assert client.request("scene-search", {}) == "data"
+    client.close()
+
+
+def test_rate_limiter_slows_down_and_recovers():
+    limiter = RateLimiter(rates={"search": (4.0, 2)}, decrease_factor=0.5, recovery_step=1.0)
+    assert limiter.reserve("scene-search") == 0.0
+    assert limiter.reserve("scene-search") == 0.0
+    assert limiter.reserve("scene-search") > 0.0
+    assert RateLimiter.is_throttle(M2MError("RATE_LIMIT"))
+    limiter.on_throttle("scene-search")
+    assert limiter.current_rates()["search"] == 2.0
+    limiter.on_success("scene-search")
+    limiter.on_success("scene-search")
+    limiter.on_success("scene-search")
+    assert limiter.current_rates()["search"] == 4.0
+    assert limiter.current_rates()["options"] == 2.0
+
+
+def _fake_search(total, server_page_limit):
+    requests_seen = []
+
+    async def call(endpoint, payload):
+        requests_seen.append(payload["startingNumber"])
+        start = payload["startingNumber"]
+        count = min(payload["maxResults"], server_page_limit, total - start + 1)
+        results = [{"entityId": f"E{n}"} for n in range(start, start + count)]
+        next_record = start + count if start + count <= total else None
+        return {"results": results, "totalHits": total, "nextRecord": next_record}
+
+    return call, requests_seen
+
+
+def test_scene_search_fetches_all_pages():
+    call, starts = _fake_search(total=25, server_page_limit=10)
+    results = asyncio.run(_scene_search_all(call, "landsat_ot_c2_l2", {}, page_size=50))
+    assert [r["entityId"] for r in results] == [f"E{n}" for n in range(1, 26)]
+    assert sorted(starts) == [1, 11, 21]
+
+
+def test_scene_search_respects_max_scenes():
+    call, starts = _fake_search(total=25, server_page_limit=10)
+    results = asyncio.run(_scene_search_all(call, "landsat_ot_c2_l2", {}, max_scenes=15, page_size=50))
+    assert len(results) == 15
+    assert sorted(starts) == [1, 11]
+
+
+def test_sensor_from_display_id():
+    assert _sensor_from_display_id("LC08_L2SP_042035_20220115_20220123_02_T1") == "L8"
+    assert _sensor_from_display_id("LC09_L2SP_042035_20220107_20220110_02_T1") == "L9"
+    assert _sensor_from_display_id("LE07_L2SP_042035_20220111_20220206_02_T1") == "L7"
+    assert _sensor_from_display_id("LT05_L2SP_042035_20110115_20200822_02_T1") == "L5"
+    assert _sensor_from_display_id("bogus") is None
+
+
+def test_plan_acquisition_windows():
+    assert _plan_acquisition_windows("2022-01-15", "2022-03-10") == [("2022-01-15", "2022-03-10")]
+    assert _plan_acquisition_windows("2022-11-15", "2023-01-10", "month") == [
+        ("2022-11-15", "2022-11-30"), ("2022-12-01", "2022-12-31"), ("2023-01-01", "2023-01-10")]
+    assert _plan_acquisition_windows("2021-06-01", "2022-02-01", "year") == [
+        ("2021-06-01", "2021-12-31"), ("2022-01-01", "2022-02-01")]
+    assert _plan_acquisition_windows("2022-01-01", "2022-01-05", 2) == [
+        ("2022-01-01", "2022-01-02"), ("2022-01-03", "2022-01-04"), ("2022-01-05", "2022-01-05")]
+    with pytest.raises(ValueError):
+        _plan_acquisition_windows("2022-01-01", "2022-01-05", "week")
+
+
+def test_merge_scene_results_dedupes_by_entity_id():
+    merged = _merge_scene_results([[{"entityId": "A"}, {"entityId": "B"}], [{"entityId": "B"}, {"entityId": "C"}]])
+    assert [scene["entityId"] for scene in merged] == ["A", "B", "C"]
+
+
+def test_bounding_box_polygon_has_all_four_corners():
+    (polygon,) = _parse_bounding_box("-120.0,35.0,-119.0,36.0")
+    assert polygon["coordinates"] == [[[-120.0, 35.0], [-119.0, 35.0], [-119.0, 36.0], [-120.0, 36.0], [-120.0, 35.0]]]
+
+
+def test_bounding_box_crossing_antimeridian_is_split():
+    west, east = _parse_bounding_box("170.0,-20.0,-170.0,-10.0")
+    assert west["coordinates"][0][0] == [170.0, -20.0] and west["coordinates"][0][1] == [180.0, -20.0]
+    assert east["coordinates"][0][0] == [-180.0, -20.0] and east["coordinates"][0][1] == [-170.0, -20.0]
+
+
+def test_resolve_aoi_multipolygon_file_with_simplification(tmp_path):
+    dense_edge = [[-120.0 + i / 100, 35.0] for i in range(101)]
+    square = dense_edge + [[-119.0, 36.0], [-120.0, 36.0], [-120.0, 35.0]]
+    triangle = [[10.0, 10.0], [11.0, 10.0], [10.0, 11.0], [10.0, 10.0]]
+    aoi_file = tmp_path / "aoi.geojson"
+    aoi_file.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {}, "geometry": {"type": "MultiPolygon", "coordinates": [[square], [triangle]]}},
+    ]}))
+    polygons = _resolve_aoi(aoi_feature_class=str(aoi_file), simplify_tolerance=0.001)
+    assert len(polygons) == 2
+    ring = polygons[0]["coordinates"][0]
+    assert len(ring) == 5 and ring[0] == ring[-1]
+    assert sorted(map(tuple, ring[:-1])) == [(-120.0, 35.0), (-120.0, 36.0), (-119.0, 35.0), (-119.0, 36.0)]
+    assert polygons[1]["coordinates"][0] == triangle
+
+
+def test_collinear_segments_cross_only_when_overlapping():
+    assert not _segments_cross((0, 0), (1, 0), (2, 0), (3, 0))
+    assert _segments_cross((0, 0), (2, 0), (1, 0), (3, 0))
+    assert _segments_cross((0, 0), (1, 0), (1, 0), (3, 0))
+    assert not _rings_intersect([[0, 0], [1, 0], [1, 1], [0, 1]], [[2, 0], [3, 0], [3, 1], [2, 1]])
+    assert _rings_intersect([[0, 0], [1, 0], [1, 1], [0, 1]], [[1, 0], [2, 0], [2, 1], [1, 1]])
+
+
+def test_wrs2_index_roundtrip_and_lookup(tmp_path):
+    index = WRS2Index(
+        paths=array("B", [42, 1]),
+        rows=array("B", [35, 1]),
+        corner_lons=array("h", [-12000, -11800, -11850, -12050, 17900, -17900, -17950, 17850]),
+        corner_lats=array("h", [3600, 3600, 3430, 3430, 1000, 1000, 800, 800]),
+    )
+    index.save(str(tmp_path / "wrs2.bin"))
+    index = WRS2Index.load(str(tmp_path / "wrs2.bin"))
+    assert len(index) == 2
+    inland = {"type": "Polygon", "coordinates": [[[-119.5, 35], [-119, 35], [-119, 35.5], [-119.5, 35]]]}
+    across_antimeridian = {"type": "Polygon", "coordinates": [[[-179.8, 9], [-179.6, 9], [-179.6, 9.5], [-179.8, 9]]]}
+    ocean = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}
+    assert index.path_rows(inland) == [(42, 35)]
+    assert index.path_rows(across_antimeridian) == [(1, 1)]
+    assert index.path_rows(ocean) == []
+
+
+def test_scene_catalog_incremental_sync(tmp_path):
+    catalog = SceneCatalog(path=str(tmp_path / "catalog.sqlite"), resync_days=10)
+    key = SceneCatalog.make_aoi_key("landsat_ot_c2_l2", {"spatialFilter": {}}, 20)
+    assert catalog.missing_ranges(key, "2022-01-01", "2022-03-31") == [("2022-01-01", "2022-03-31")]
+    catalog.add_scenes(key, "landsat_ot_c2_l2", [
+        {"entityId": "E1", "displayId": "LC08_L2SP_042035_20220115_20220123_02_T1", "cloudCover": "5.0"},
+        {"entityId": "E2", "displayId": "LC09_L2SP_042035_20220302_20220304_02_T1", "cloudCover": "40"},
+    ])
+    catalog.mark_synced(key, "2022-01-01", "2022-03-31")
+
+    assert catalog.missing_ranges(key, "2022-01-10", "2022-02-28") == []
+    assert catalog.missing_ranges(key, "2022-02-01", "2022-04-30") == [("2022-03-21", "2022-04-30")]
+    assert catalog.missing_ranges(key, "2021-12-01", "2022-01-31") == [("2021-12-01", "2022-01-01")]
+    assert [scene["entityId"] for scene in catalog.query(key, "2022-01-01", "2022-03-31")] == ["E1", "E2"]
+    assert [scene["entityId"] for scene in catalog.query(key, "2022-01-01", "2022-03-31", 20)] == ["E1"]
+    catalog.close()
+
+
+def test_download_manifest_filters_completed_files(tmp_path):
+    manifest = DownloadManifest(str(tmp_path))
+    done = tmp_path / "done.TIF"
+    done.write_bytes(b"12345")
+    manifest.record("E1", "P1", str(done), size=5, checksum="abc")
+    manifest.record("E2", "P2", str(tmp_path / "missing.TIF"), size=5)
+
+    reloaded = DownloadManifest(str(tmp_path))
+    downloads = [{"entityId": "E1", "productId": "P1"}, {"entityId": "E2", "productId": "P2"},
+                 {"entityId": "E3", "productId": "P3"}]
+    assert [item["entityId"] for item in reloaded.pending(downloads)] == ["E2", "E3"]
+    done.write_bytes(b"123")
+    assert not reloaded.is_complete("E1")
+
+
+def test_download_registry_dedupes_and_tracks_states():
+    registry = DownloadRegistry([{"entityId": "E1", "productId": "P1"}, {"entityId": "E2", "productId": "P2"}])
+    registry.mark_preparing([{"downloadId": 7, "entityId": "E2"}])
+    assert registry.waiting() == 2
+
+    first = {"downloadId": 6, "entityId": "E1", "url": "https://example.com/E1"}
+    assert registry.offer(first)
+    assert not registry.offer(dict(first))
+    assert not registry.offer({"downloadId": 7, "entityId": "E2"})  # No URL yet.
+    assert registry.waiting() == 1
+
+    registry.set_state(first, DownloadRegistry.DONE)
+    assert not registry.offer(first)
+    assert registry.offer({"downloadId": 7, "entityId": "E2", "url": "https://example.com/E2"})
+    assert registry.waiting() == 0
+    assert registry.summary() == {"done": 1, "available": 1}
+
+
+def test_download_registry_keys_on_download_id_and_marks_rejected_files():
+    registry = DownloadRegistry([{"entityId": "A", "productId": "P1"}, {"entityId": "B", "productId": "P2"},
+                                 {"entityId": "C", "productId": "P3"}])
+    # download-request items carry no entityId; the file is queued once download-retrieve names it.
+    assert not registry.offer({"downloadId": 1, "url": "u1"})
+    assert registry.waiting() == 3
+    assert registry.offer({"downloadId": 1, "entityId": "A", "url": "u1"})
+    assert not registry.offer({"downloadId": 1, "entityId": "A", "url": "u1"})
+    assert not registry.offer({"downloadId": 1, "url": "u1"})
+    assert registry.waiting() == 2
+
+    registry.mark_failed([{"productId": "P3", "errorMessage": "not orderable"}])
+    assert registry.waiting() == 1
+    assert registry.offer({"downloadId": 2, "entityId": "B", "url": "u2"})
+    assert registry.waiting() == 0
+    assert registry.summary() == {"available": 2, "failed": 1}
+
+
+def test_download_registry_keeps_one_record_per_file():
+    registry = DownloadRegistry([{"entityId": f"E{i}", "productId": f"P{i}"} for i in range(30)])
+    # download-request names only downloadIds, so none of them can be attributed to a file yet.
+    registry.mark_preparing([{"downloadId": i} for i in range(30)])
+    assert registry.summary() == {"requested": 30}
+
+    for i in range(10):
+        assert registry.offer({"downloadId": i, "entityId": f"E{i}", "url": f"u{i}"})
+        registry.set_state({"downloadId": i, "url": f"u{i}"}, DownloadRegistry.DONE)  # Resolved via the link.
+    registry.mark_preparing([{"downloadId": 10, "entityId": "E10"}])
+    assert registry.summary() == {"done": 10, "preparing": 1, "requested": 19}
+    assert registry.waiting() == 20
+    assert registry.count(DownloadRegistry.DONE) == 10
+
+
+def test_download_scheduler_policies():
+    files = [("A_B4", 30, "2022-01-20", "A"), ("B_B4", 50, "2022-01-04", "B"), ("A_B5", 10, "2022-01-20", "A")]
+
+    async def drain(order):
+        scheduler = DownloadScheduler(order)
+        for entity_id, size, acquired, scene in files:
+            scheduler.describe(entity_id, size, acquired, scene)
+        scheduler.put_nowait(None)
+        for entity_id in ["B_B4", "A_B5", "A_B4"]:  # Order in which the URLs became available.
+            await scheduler.put({"entityId": entity_id})
+        drained = []
+        while (item := await scheduler.get()) is not None:
+            drained.append(item["entityId"])
+        return drained
+
+    assert asyncio.run(drain("fifo")) == ["B_B4", "A_B5", "A_B4"]
+    assert asyncio.run(drain("largest_first")) == ["B_B4", "A_B4", "A_B5"]
+    assert asyncio.run(drain("acquisition_date")) == ["B_B4", "A_B5", "A_B4"]
+    assert asyncio.run(drain("by_scene")) == ["A_B5", "A_B4", "B_B4"]
+    with pytest.raises(ValueError):
+        DownloadScheduler("random")
+
+
+def test_adaptive_concurrency_grows_with_throughput_and_backs_off_on_errors():
+    async def main():
+        limiter = AdaptiveConcurrencyLimiter(2, minimum=1, maximum=4, interval=0)
+        async with limiter:
+            async with limiter:  # All slots busy while bytes arrive.
+                limiter.record_bytes(1 << 20)
+            grown = limiter.limit
+            limiter.record_error()
+        return limiter, grown
+
+    limiter, grown = asyncio.run(main())
+    assert grown == 3
+    assert limiter.limit == 1
+    assert [limit for _, limit in limiter.history] == [2, 3, 1]
+    stats = limiter.stats()
+    assert stats["bytes_downloaded"] == 1 << 20 and stats["transient_errors"] == 1
+
+    fixed = AdaptiveConcurrencyLimiter(5)
+    assert not fixed.adaptive and fixed.limit == 5
+
+
+def test_fetch_to_file_resumes_partial_download(tmp_path):
+    payload = os.urandom(300_000)
+    source = tmp_path / "source.tar.gz"
+    source.write_bytes(payload)
+    final_path = tmp_path / "out" / "scene.tar.gz"
+    final_path.parent.mkdir()
+    (tmp_path / "out" / "scene.tar.gz.part").write_bytes(payload[:120_000])
+    ranges = []
+
+    async def handler(request):
+        ranges.append(request.headers.get("Range"))
+        return web.FileResponse(source)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            return await _fetch_to_file(session, str(server.make_url("/file")), str(final_path))
+
+    size, checksum = asyncio.run(run())
+    assert ranges == ["bytes=120000-"]
+    assert final_path.read_bytes() == payload
+    assert (size, checksum) == (len(payload), hashlib.sha256(payload).hexdigest())
+    assert not os.path.exists(str(final_path) + ".part")
+
+
+def test_transfer_config_timeouts_and_stall_detection(tmp_path):
+    transfer = TransferConfig(limit_per_host=4, connect_timeout=5, sock_read_timeout=7,
+                              stall_timeout=0, stall_min_bytes=10)
+    timeout = transfer.timeout()
+    assert timeout.total is None and timeout.sock_connect == 5 and timeout.sock_read == 7
+
+    received = transfer.stall_watch()
+    received(10)  # Enough for the window.
+    with pytest.raises(TransferStalledError):
+        received(5)
+
+    async def handler(request):
+        return web.Response(body=b"x" * 100)
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            async with TransferConfig(limit_per_host=2).session() as session:
+                assert session.connector.limit_per_host == 2
+                result = await _fetch_to_file(session, str(server.make_url("/file")), str(tmp_path / "ok.bin"))
+                with pytest.raises(TransferStalledError):
+                    await _fetch_to_file(session, str(server.make_url("/file")), str(tmp_path / "slow.bin"),
+                                         attempts=1, transfer=TransferConfig(stall_timeout=0, stall_min_bytes=1000))
+            return result
+
+    assert asyncio.run(main())[0] == 100
+
+
+def test_fetch_segmented_downloads_ranges_concurrently(tmp_path):
+    payload = os.urandom(400_000)
+    source = tmp_path / "bundle.tar.gz"
+    source.write_bytes(payload)
+    final_path = tmp_path / "scene.tar.gz"
+    ranges = []
+
+    async def handler(request):
+        ranges.append(request.headers.get("Range"))
+        return web.FileResponse(source)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            return await _fetch_segmented(session, str(server.make_url("/file")), str(final_path),
+                                          segments=4, min_segment_size=50_000)
+
+    size, checksum = asyncio.run(run())
+    assert ranges[0] == "bytes=0-0"
+    assert sorted(ranges[1:]) == ["bytes=0-99999", "bytes=100000-199999", "bytes=200000-299999", "bytes=300000-399999"]
+    assert final_path.read_bytes() == payload
+    assert (size, checksum) == (len(payload), hashlib.sha256(payload).hexdigest())
+
+
+def test_fetch_segmented_stops_other_segments_when_one_fails(tmp_path):
+    total = 400_000
+
+    async def handler(request):
+        first, _, last = request.headers["Range"][len("bytes="):].partition("-")
+        if first != "0":
+            return web.Response(body=b"x" * total)  # Ignores the range.
+        response = web.StreamResponse(status=206, headers={
+            "Content-Range": f"bytes {first}-{last}/{total}", "Content-Length": str(int(last) + 1)})
+        await response.prepare(request)
+        for _ in range(int(last) // 10_000 + 1):
+            await response.write(b"y" * 10_000)
+            await asyncio.sleep(0.05)
+        return response
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            with pytest.raises(ValueError):
+                await _fetch_segmented(session, str(server.make_url("/file")), str(tmp_path / "scene.tar.gz"),
+                                       segments=4, min_segment_size=50_000)
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+                    and "_fetch_segment" in repr(task.get_coro())]
+
+    assert asyncio.run(run()) == []
+
+
+def _make_bundle(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_stream_extract_writes_members_without_archive(tmp_path):
+    bundle = _make_bundle({"LC08_SR_B4.TIF": os.urandom(200_000), "LC08_MTL.txt": b"metadata"})
+
+    async def handler(request):
+        return web.Response(body=bundle)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/bundle", handler)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            return await _stream_extract(session, str(server.make_url("/bundle")), str(tmp_path / "scene"))
+
+    size, checksum = asyncio.run(run())
+    assert sorted(os.listdir(tmp_path / "scene")) == ["LC08_MTL.txt", "LC08_SR_B4.TIF"]
+    assert (tmp_path / "scene" / "LC08_MTL.txt").read_bytes() == b"metadata"
+    assert (size, checksum) == (len(bundle), hashlib.sha256(bundle).hexdigest())
+
+
+def test_extract_archive_in_process_pool(tmp_path):
+    archive = tmp_path / "scene.tar.gz"
+    archive.write_bytes(_make_bundle({"LC08_SR_B2.TIF": b"band"}))
+    with _make_extraction_executor("process", 1) as executor:
+        assert executor._mp_context.get_start_method() != "fork"
+        executor.submit(_extract_archive, str(archive), str(tmp_path / "scene"), True).result()
+    assert (tmp_path / "scene" / "LC08_SR_B2.TIF").read_bytes() == b"band"
+    assert not archive.exists()
+    with pytest.raises(ValueError):
+        _make_extraction_executor("fiber", 1)
+
+
+def test_extract_archive_selected_members(tmp_path):
+    archive = tmp_path / "scene.tar.gz"
+    archive.write_bytes(_make_bundle({name: b"x" for name in [
+        "LC08_SR_B4.TIF", "LC08_SR_B5.TIF", "LC08_QA_PIXEL.TIF", "LC08_ST_B10.TIF", "LC08_ANG.txt"]}))
+    include = _compile_member_patterns(["*_SR_B*.tif", "*_QA_PIXEL.TIF"])
+    exclude = _compile_member_patterns(["*_B5.TIF"])
+    _extract_archive(str(archive), str(tmp_path / "scene"), False, include, exclude)
+    assert sorted(os.listdir(tmp_path / "scene")) == ["LC08_QA_PIXEL.TIF", "LC08_SR_B4.TIF"]
+    assert _compile_member_patterns(None) is None
+
+
+class FakeM2M:
+    """Minimal stand-in for the M2M API: two L8 scenes whose B4 files become ready over two polls."""
+
+    files = ("E1_B4", "E2_B4")  # What the download request is answered with.
+
+    def __init__(self, file_url):
+        self.file_url = file_url
+        self.calls = []
+
+    def request(self, endpoint, payload, apiKey=None):
+        self.calls.append(endpoint)
+        if endpoint == "login-token":
+            return "api-key"
+        if endpoint == "scene-search":
+            return {"totalHits": 2, "nextRecord": None, "results": [
+                {"entityId": "E1", "displayId": "LC08_L2SP_042035_20220115_20220123_02_T1"},
+                {"entityId": "E2", "displayId": "LC08_L2SP_042035_20220131_20220204_02_T1"},
+            ]}
+        if endpoint == "download-options":
+            return [{"entityId": e, "available": True, "secondaryDownloads": [
+                {"available": True, "entityId": f"{e}_B4", "id": f"P{e}",
+                 "displayId": f"LC08_L2SP_042035_2022_{e}_SR_B4.TIF"},
+                {"available": True, "entityId": f"{e}_B5", "id": f"Q{e}",
+                 "displayId": f"LC08_L2SP_042035_2022_{e}_SR_B5.TIF"},
+            ]} for e in payload["entityIds"]]
+        if endpoint == "download-request":
+            available = self._available(self.files[0])
+            del available["entityId"]  # download-request does not name the entity.
+            return {"availableDownloads": [available], "preparingDownloads": [{"downloadId": self.files[1]}]}
+        if endpoint == "download-retrieve":
+            ready = [self._available(self.files[0])]
+            if self.calls.count("download-retrieve") > 1:
+                ready.append(self._available(self.files[1]))
+            return {"available": ready, "requested": []}
+        raise AssertionError(endpoint)
+
+    def _available(self, entity_id):
+        return {"downloadId": entity_id, "entityId": entity_id, "url": f"{self.file_url}?id={entity_id}"}
+
+
+def test_download_job_end_to_end(tmp_path):
+    served = []
+
+    async def handler(request):
+        served.append(request.query["id"])
+        return web.Response(body=b"tif-" + request.query["id"].encode())
+
+    async def run(fake):
+        return await download_landsat_async(
+            output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+            bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], bands=["B4"],
+            use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+            poll_initial_interval=0.01, client=fake)
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            first = await run(FakeM2M(str(server.make_url("/file"))))
+            rerun_fake = FakeM2M(str(server.make_url("/file")))
+            second = await run(rerun_fake)
+            return first, second, rerun_fake
+
+    first, second, rerun_fake = asyncio.run(main())
+    assert first == f"Successfully downloaded 2 files to {tmp_path}."
+    assert sorted(served) == ["E1_B4", "E2_B4"]
+    assert (tmp_path / "E2_B4.TIF").read_bytes() == b"tif-E2_B4"
+    assert second.startswith("All 2 files are already downloaded")
+    assert "download-request" not in rerun_fake.calls
+
+
+class ManyScenesFakeM2M(FakeM2M):
+    """Thirty L8 scenes; a third of their B4 files are ready at the first poll, the rest at the second."""
+
+    def request(self, endpoint, payload, apiKey=None):
+        if endpoint == "scene-search":
+            self.calls.append(endpoint)
+            return {"totalHits": 30, "nextRecord": None, "results": [
+                {"entityId": f"E{i}", "displayId": f"LC08_L2SP_042035_202201{i + 1:02d}_20220201_02_T1"}
+                for i in range(30)]}
+        if endpoint == "download-request":
+            self.calls.append(endpoint)
+            return {"availableDownloads": [], "preparingDownloads": [
+                {"downloadId": item["entityId"]} for item in payload["downloads"]]}
+        if endpoint == "download-retrieve":
+            self.calls.append(endpoint)
+            ready = 10 if self.calls.count("download-retrieve") == 1 else 30
+            return {"available": [self._available(f"E{i}_B4") for i in range(ready)], "requested": []}
+        return super().request(endpoint, payload, apiKey)
+
+
+def test_download_job_keeps_polling_while_workers_are_busy(tmp_path):
+    async def handler(request):
+        await asyncio.sleep(0.1)
+        return web.Response(body=b"tif")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            return await download_landsat_async(
+                output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], bands=["B4"],
+                use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+                max_concurrent_downloads=1, poll_initial_interval=0.01, poll_deadline=0.5,
+                run_stats=run_stats, client=ManyScenesFakeM2M(str(server.make_url("/file"))))
+
+    run_stats = {}
+    # A single worker needs ~3s for the files, far beyond poll_deadline; the poller must not wait on it.
+    assert asyncio.run(main()) == f"Successfully downloaded 30 files to {tmp_path}."
+    assert run_stats["download_states"] == {"done": 30}
+
+
+class ExpiringURLFakeM2M(FakeM2M):
+    def _available(self, entity_id):
+        item = super()._available(entity_id)
+        # URLs handed out before the third download-retrieve call have expired.
+        item["url"] += "&sig=" + ("old" if self.calls.count("download-retrieve") <= 2 else "new")
+        return item
+
+
+def test_download_job_retries_transient_errors_and_refreshes_expired_urls(tmp_path):
+    served = []
+
+    async def handler(request):
+        entity_id = request.query["id"]
+        served.append((entity_id, request.query["sig"]))
+        if entity_id == "E2_B4" and request.query["sig"] == "old":
+            return web.Response(status=403)
+        if served.count((entity_id, request.query["sig"])) == 1 and entity_id == "E1_B4":
+            return web.Response(status=503)
+        return web.Response(body=b"tif-" + entity_id.encode())
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            fake = ExpiringURLFakeM2M(str(server.make_url("/file")))
+            result = await download_landsat_async(
+                output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], bands=["B4"],
+                use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+                poll_initial_interval=0.01, client=fake,
+                download_retry_policy=RetryPolicy(max_attempts=3, backoff_base=0.01, jitter=False),
+                run_stats=run_stats)
+            return result, fake
+
+    run_stats = {}
+
+    result, fake = asyncio.run(main())
+    assert result == f"Successfully downloaded 2 files to {tmp_path}."
+    assert served.count(("E1_B4", "old")) == 2
+    assert ("E2_B4", "new") in served
+    assert (tmp_path / "E2_B4.TIF").read_bytes() == b"tif-E2_B4"
+    assert fake.calls.count("download-retrieve") == 3
+    assert run_stats["download_states"] == {"done": 2}
+    assert run_stats["transient_errors"] == 1
+
+
+class TMFakeM2M(FakeM2M):
+    def request(self, endpoint, payload, apiKey=None):
+        if endpoint == "scene-search":
+            self.calls.append(endpoint)
+            assert payload["datasetName"] == "landsat_tm_c2_l2"
+            return {"totalHits": 2, "nextRecord": None, "results": [
+                {"entityId": "E1", "displayId": "LT04_L2SP_042035_19890115_20200916_02_T1"},
+                {"entityId": "E2", "displayId": "LT05_L2SP_042035_19890123_20200916_02_T1"},
+            ]}
+        return super().request(endpoint, payload, apiKey)
+
+
+def test_download_job_l5_includes_landsat_4_scenes(tmp_path):
+    async def handler(request):
+        return web.Response(body=b"tif")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            return await download_landsat_async(
+                output_directory=str(tmp_path), start_date="1989-01-01", end_date="1989-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L5"], bands=["B4"],
+                use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+                poll_initial_interval=0.01, client=TMFakeM2M(str(server.make_url("/file"))))
+
+    assert asyncio.run(main()) == f"Successfully downloaded 2 files to {tmp_path}."
+
+
+class RejectingFakeM2M(FakeM2M):
+    def request(self, endpoint, payload, apiKey=None):
+        if endpoint == "download-request":
+            self.calls.append(endpoint)
+            return {"availableDownloads": [], "preparingDownloads": [{"downloadId": "E1_B4"}],
+                    "failed": [{"productId": "PE2", "errorMessage": "Product is not orderable"}]}
+        if endpoint == "download-retrieve":
+            self.calls.append(endpoint)
+            return {"available": [self._available("E1_B4")], "requested": []}  # E2_B4 never arrives.
+        return super().request(endpoint, payload, apiKey)
+
+
+def test_download_job_does_not_wait_for_rejected_files(tmp_path):
+    async def handler(request):
+        return web.Response(body=b"tif")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            fake = RejectingFakeM2M(str(server.make_url("/file")))
+            result = await asyncio.wait_for(download_landsat_async(
+                output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], bands=["B4"],
+                use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+                poll_initial_interval=0.01, run_stats=run_stats, client=fake), timeout=10)
+            return result, fake
+
+    run_stats = {}
+    result, fake = asyncio.run(main())
+    assert result == f"Successfully downloaded 1 files to {tmp_path}."
+    assert fake.calls.count("download-retrieve") == 1
+    assert run_stats["download_states"] == {"done": 1, "failed": 1}
+
+
+def test_download_job_attempt_budget_covers_interrupted_transfers(tmp_path):
+    served = []
+
+    async def handler(request):
+        served.append(request.query["id"])
+        if request.query["id"] != "E1_B4":
+            return web.Response(body=b"tif")
+        response = web.StreamResponse(headers={"Content-Length": "100"})
+        await response.prepare(request)
+        await response.write(b"x" * 10)
+        request.transport.close()  # Drops the connection mid-body.
+        return response
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            return await download_landsat_async(
+                output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], bands=["B4"],
+                use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+                poll_initial_interval=0.01, client=FakeM2M(str(server.make_url("/file"))),
+                download_retry_policy=RetryPolicy(max_attempts=2, backoff_base=0.01, jitter=False))
+
+    assert asyncio.run(main()) == f"Successfully downloaded 1 files to {tmp_path}."
+    assert served.count("E1_B4") == 2
+
+
+class NoDatasetFiltersFakeM2M(FakeM2M):
+    def __init__(self, file_url):
+        super().__init__(file_url)
+        self.scene_filters = []
+
+    def request(self, endpoint, payload, apiKey=None):
+        if endpoint == "dataset-filters":
+            raise M2MError("UNKNOWN", "dataset-filters is unavailable")
+        if endpoint == "scene-search":
+            self.scene_filters.append(payload["sceneFilter"])
+        return super().request(endpoint, payload, apiKey)
+
+
+def test_wrs2_search_falls_back_to_spatial_filter_when_filters_lookup_fails(tmp_path):
+    index = WRS2Index(paths=array("B", [42]), rows=array("B", [35]),
+                      corner_lons=array("h", [-12000, -11800, -11850, -12050]),
+                      corner_lats=array("h", [3600, 3600, 3430, 3430]))
+
+    async def handler(request):
+        return web.Response(body=b"tif")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            fake = NoDatasetFiltersFakeM2M(str(server.make_url("/file")))
+            result = await download_landsat_async(
+                output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], bands=["B4"],
+                wrs2_index=index, use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+                poll_initial_interval=0.01, client=fake)
+            return result, fake
+
+    result, fake = asyncio.run(main())
+    assert result == f"Successfully downloaded 2 files to {tmp_path}."
+    assert all("spatialFilter" in scene_filter for scene_filter in fake.scene_filters)
+
+
+class BundleFakeM2M(FakeM2M):
+    files = ("E1", "E2")
+
+
+def test_download_job_counts_bundles_only_after_extraction(tmp_path):
+    bundle = _make_bundle({"LC08_SR_B4.TIF": b"band"})
+
+    async def handler(request):
+        return web.Response(body=bundle if request.query["id"] == "E1" else b"not a tar archive")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            return await download_landsat_async(
+                output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], use_search_cache=False,
+                api_key_manager=ApiKeyManager(username="u", token="t"), poll_initial_interval=0.01,
+                run_stats=run_stats, client=BundleFakeM2M(str(server.make_url("/file"))))
+
+    run_stats = {}
+    assert asyncio.run(main()) == f"Successfully downloaded 1 files to {tmp_path}."
+    assert run_stats["download_states"] == {"done": 1, "failed": 1}
+    assert (tmp_path / "LC08_L2SP_042035_20220115_20220123_02_T1" / "LC08_SR_B4.TIF").read_bytes() == b"band"
+
+
+def test_download_job_sizes_the_connection_pool_for_segmented_downloads(tmp_path, monkeypatch):
+    limits = []
+    session = TransferConfig.session
+
+    def recording_session(self):
+        limits.append((self.limit, self.limit_per_host))
+        return session(self)
+
+    monkeypatch.setattr(TransferConfig, "session", recording_session)
+
+    async def handler(request):
+        return web.Response(body=b"tif")
+
+    async def run(**options):
+        app = web.Application()
+        app.router.add_get("/file", handler)
+        async with TestServer(app) as server:
+            return await download_landsat_async(
+                output_directory=str(tmp_path), start_date="2022-01-01", end_date="2022-01-31",
+                bounding_box="-120.0,35.0,-119.0,36.0", landsat_sensors=["L8"], bands=["B4"],
+                use_search_cache=False, api_key_manager=ApiKeyManager(username="u", token="t"),
+                max_concurrent_downloads=5, download_segments=4, poll_initial_interval=0.01,
+                client=FakeM2M(str(server.make_url("/file"))), **options)
+
+    assert asyncio.run(run()) == f"Successfully downloaded 2 files to {tmp_path}."
+    assert limits == [(100, 20)]
+    result = asyncio.run(run(transfer_config=TransferConfig(limit_per_host=16)))
+    assert result.startswith("Error: transfer_config allows 100 connections (16 per host)")
+    assert len(limits) == 1